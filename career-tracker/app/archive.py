@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, literal, or_, union_all
+from sqlmodel import Session, select
+
+from .database import engine
+from .changes import prune_changes, record_changes
+from .models import ApplicationStatus, ArchivedJobApplication, JobApplication
+
+# Archive configuration
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_TERMINAL_AFTER_DAYS = int(os.getenv("ARCHIVE_TERMINAL_AFTER_DAYS", "30"))
+ARCHIVE_TERMINAL_STATUSES = [
+    ApplicationStatus(value.strip())
+    for value in os.getenv("ARCHIVE_TERMINAL_STATUSES", "rejected").split(",")
+    if value.strip()
+]
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+# Zero disables the background job
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+APPLICATION_COLUMNS = ("id", "company", "position", "status", "date_applied", "user_id")
+
+logger = logging.getLogger("archive")
+
+
+def _columns(model) -> list:
+    return [getattr(model, name) for name in APPLICATION_COLUMNS]
+
+
+def stale_clause(now: datetime):
+    clause = JobApplication.date_applied < now - timedelta(days=ARCHIVE_AFTER_DAYS)
+    if ARCHIVE_TERMINAL_STATUSES:
+        clause = or_(clause, (
+            JobApplication.status.in_(ARCHIVE_TERMINAL_STATUSES)
+            & (JobApplication.date_applied
+               < now - timedelta(days=ARCHIVE_TERMINAL_AFTER_DAYS))
+        ))
+    return clause
+
+
+def archive_batch(session: Session, now: datetime) -> List[int]:
+    """Move one batch of stale applications to the archive table"""
+    # Rows whose id is taken in the archive already (ids reused by an old
+    # table without AUTOINCREMENT) can't move; they stay in the hot table
+    rows = session.exec(
+        select(JobApplication.id, JobApplication.user_id)
+        .where(stale_clause(now))
+        .where(~select(ArchivedJobApplication.id)
+               .where(ArchivedJobApplication.id == JobApplication.id)
+               .exists())
+        .order_by(JobApplication.id)
+        .limit(ARCHIVE_BATCH_SIZE)
+    ).all()
+    if not rows:
+        return []
+
+    ids = [application_id for application_id, _ in rows]
+    by_user = {}
+    for application_id, user_id in rows:
+        by_user.setdefault(user_id, []).append(application_id)
+
+    session.exec(
+        insert(ArchivedJobApplication).from_select(
+            list(APPLICATION_COLUMNS) + ["archived_at"],
+            select(*_columns(JobApplication), literal(now))
+            .where(JobApplication.id.in_(ids)),
+        )
+    )
+    session.exec(delete(JobApplication).where(JobApplication.id.in_(ids)))
+    for user_id, user_ids in by_user.items():
+        record_changes(session, user_id, user_ids, "archive")
+    session.commit()
+    return ids
+
+
+def archive_stale_applications() -> int:
+    now = datetime.now()
+    moved = 0
+    with Session(engine) as session:
+        while True:
+            ids = archive_batch(session, now)
+            if not ids:
+                break
+            moved += len(ids)
+    if moved:
+        logger.info(f"Archived {moved} job applications")
+    return moved
+
+
+async def run_archiver():
+    while True:
+        try:
+            await run_in_threadpool(archive_stale_applications)
+            await run_in_threadpool(prune_changes)
+        except Exception as e:
+            logger.error(f"Error archiving job applications: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+def get_application(session: Session, application_id: int):
+    """The application with this id, from the hot table or else the archive
+
+    Archived rows keep their id, so single-application reads, updates and
+    deletes work the same whichever table the row is in.
+    """
+    application = session.get(JobApplication, application_id)
+    if application is None:
+        application = session.get(ArchivedJobApplication, application_id)
+    return application
+
+
+def read_applications(
+    session: Session,
+    filters: Callable,
+    order_by: Callable,
+    limit: int,
+    skip: int = 0,
+    include_archived: bool = False,
+) -> List[JobApplication]:
+    """Read a page of applications from the hot table, optionally with the archive
+
+    filters(model) and order_by(model) return the WHERE clauses and sort
+    keys for either table (or the combined subquery's columns).
+    """
+    if not include_archived:
+        return session.exec(
+            select(JobApplication)
+            .where(*filters(JobApplication))
+            .order_by(*order_by(JobApplication))
+            .offset(skip)
+            .limit(limit)
+        ).all()
+
+    # Each side is cut to the page window along its own index before merging
+    parts = [
+        select(*_columns(model))
+        .where(*filters(model))
+        .order_by(*order_by(model))
+        .limit(skip + limit)
+        .subquery()
+        for model in (JobApplication, ArchivedJobApplication)
+    ]
+    combined = union_all(*(select(part) for part in parts)).subquery()
+    rows = session.execute(
+        select(combined)
+        .order_by(*order_by(combined.c))
+        .offset(skip)
+        .limit(limit)
+    ).mappings()
+    return [JobApplication(**row) for row in rows]
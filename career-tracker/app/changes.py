@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from .database import engine
+from .models import (
+    ApplicationChange, ApplicationChangeFeed, ApplicationChangeRead, ArchivedJobApplication,
+    JobApplication,
+)
+
+# Change feed configuration
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+
+
+def record_changes(session: Session, user_id: int, application_ids: Iterable[int], op: str):
+    # Added to the caller's transaction, so a change is visible exactly when
+    # the write it describes is
+    now = datetime.now()
+    session.add_all([
+        ApplicationChange(user_id=user_id, application_id=application_id,
+                          op=op, changed_at=now)
+        for application_id in application_ids
+    ])
+
+
+def prune_changes() -> int:
+    cutoff = datetime.now() - timedelta(days=CHANGE_FEED_RETENTION_DAYS)
+    with Session(engine) as session:
+        # The newest change always stays, so min(seq) still marks how far
+        # the feed was pruned when everything else has aged out
+        newest = select(func.max(ApplicationChange.seq)).scalar_subquery()
+        result = session.exec(
+            delete(ApplicationChange).where(
+                ApplicationChange.changed_at < cutoff,
+                ApplicationChange.seq < newest,
+            ).execution_options(synchronize_session=False))
+        session.commit()
+        return result.rowcount
+
+
+def changes_since(session: Session, user_id: int, since: int, limit: int) -> ApplicationChangeFeed:
+    changes = session.exec(
+        select(ApplicationChange)
+        .where(ApplicationChange.user_id == user_id, ApplicationChange.seq > since)
+        .order_by(ApplicationChange.seq)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    resync_required = False
+    if since:
+        oldest = session.exec(select(func.min(ApplicationChange.seq))).one()
+        resync_required = oldest is not None and oldest > since + 1
+
+    # Attach current rows with one IN query for the whole page
+    application_ids = {change.application_id for change in changes}
+    current = {}
+    if application_ids:
+        # Archived rows can still be updated, so look there as well
+        for model in (ArchivedJobApplication, JobApplication):
+            current.update({
+                application.id: JobApplication.from_orm(application)
+                for application in session.exec(
+                    select(model).where(
+                        model.user_id == user_id,
+                        model.id.in_(application_ids),
+                    )
+                )
+            })
+
+    return ApplicationChangeFeed(
+        changes=[
+            ApplicationChangeRead(
+                seq=change.seq,
+                application_id=change.application_id,
+                op=change.op,
+                changed_at=change.changed_at,
+                application=current.get(change.application_id),
+            )
+            for change in changes
+        ],
+        last_seq=changes[-1].seq if changes else since,
+        has_more=has_more,
+        resync_required=resync_required,
+    )
+
+
+def _read_changes(user_id: int, since: int, limit: int) -> ApplicationChangeFeed:
+    with Session(engine) as session:
+        return changes_since(session, user_id, since, limit)
+
+
+async def stream_changes(request: Request, user_id: int, since: int, limit: int = 100):
+    """Server-sent events for every change after since
+
+    Polls the change table, which works across workers; each event's id is
+    the change seq, so a reconnecting EventSource resumes via Last-Event-ID.
+    """
+    last_sent = time.monotonic()
+    while not await request.is_disconnected():
+        feed = await run_in_threadpool(_read_changes, user_id, since, limit)
+        for change in feed.changes:
+            yield (
+                f"id: {change.seq}\n"
+                f"event: {change.op}\n"
+                f"data: {change.json()}\n\n"
+            )
+        if feed.changes:
+            since = feed.last_seq
+            last_sent = time.monotonic()
+            if feed.has_more:
+                continue
+        elif time.monotonic() - last_sent >= CHANGE_FEED_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(CHANGE_FEED_POLL_SECONDS)
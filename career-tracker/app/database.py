@@ -1,15 +1,116 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel, Session
+from sqlalchemy import MetaData, text
+from sqlalchemy.schema import CreateTable
+from typing import Dict
 import os
 
+from .engine import build_engine
+from .models import ApplicationStatus, ArchivedJobApplication, JobApplication, normalize_status
+from .search import install_search_index
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./career_tracker.db")
+# Extra legacy statuses for the startup migration, as comma-separated
+# old=new pairs, e.g. "ghosted=rejected,on hold=pending"
+LEGACY_STATUS_MAP = os.getenv("LEGACY_STATUS_MAP", "")
 
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = build_engine(DATABASE_URL)
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    migrate_application_autoincrement()
+    # create_all only builds indexes together with new tables
+    for model in (JobApplication, ArchivedJobApplication):
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+        install_search_index(engine, model.__tablename__)
+
+
+def migrate_application_autoincrement() -> bool:
+    """Rebuild an older SQLite jobapplication table with AUTOINCREMENT
+
+    Without it SQLite hands out the highest id again once that row is
+    deleted or archived, and the new row then collides with the archived
+    one. The table is copied into a new one and swapped in; its indexes
+    and search triggers are recreated by create_db_and_tables afterwards.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    table = JobApplication.__table__
+    with engine.begin() as connection:
+        ddl = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {"name": table.name}).scalar()
+        if ddl is None or "AUTOINCREMENT" in ddl.upper():
+            return False
+
+        # A scratch copy, with the tables its foreign keys point at
+        metadata = MetaData()
+        for referred in table.foreign_keys:
+            referred.column.table.to_metadata(metadata)
+        new_table = table.to_metadata(metadata, name=f"{table.name}_new")
+        columns = ", ".join(column.name for column in table.columns)
+        connection.execute(text(f"DROP TABLE IF EXISTS {new_table.name}"))
+        connection.execute(CreateTable(new_table))
+        connection.execute(text(
+            f"INSERT INTO {new_table.name} ({columns}) SELECT {columns} FROM {table.name}"))
+        connection.execute(text(f"DROP TABLE {table.name}"))
+        connection.execute(text(f"ALTER TABLE {new_table.name} RENAME TO {table.name}"))
+        # Continue after every id handed out so far, archived ones included
+        connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"),
+                           {"name": table.name})
+        connection.execute(text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, max("
+            f"coalesce((SELECT max(id) FROM {table.name}), 0), "
+            f"coalesce((SELECT max(id) FROM {ArchivedJobApplication.__tablename__}), 0))"
+        ), {"name": table.name})
+    return True
+
+
+def legacy_status_map(spec: str = LEGACY_STATUS_MAP) -> Dict[str, str]:
+    pairs = (pair.partition("=") for pair in spec.split(",") if pair.strip())
+    return {normalize_status(old): normalize_status(new) for old, _, new in pairs}
+
+
+def migrate_status_values() -> int:
+    """Map legacy free-text statuses onto ApplicationStatus
+
+    Values are rewritten only when they normalize to a known status (by
+    case, spacing, STATUS_ALIASES or LEGACY_STATUS_MAP). If any value has
+    no mapping, nothing is rewritten and startup stops with the list, so
+    no status is ever guessed and overwritten.
+    """
+    valid = {member.value for member in ApplicationStatus}
+    extra = legacy_status_map()
+    with engine.begin() as connection:
+        counts = connection.execute(text(
+            "SELECT status, count(*) FROM jobapplication GROUP BY status"
+        )).all()
+        targets = {}
+        unknown = {}
+        for status, count in counts:
+            target = normalize_status(status)
+            target = extra.get(target, target)
+            if target not in valid:
+                unknown[status] = count
+            elif target != status:
+                targets[status] = target
+        if unknown:
+            raise RuntimeError(
+                "Applications have statuses with no mapping: "
+                + ", ".join(f"{status!r} ({count})" for status, count in sorted(unknown.items()))
+                + "; map them with LEGACY_STATUS_MAP (e.g. \"ghosted=rejected\") "
+                "or fix them in the database")
+
+        changed = 0
+        for status, target in targets.items():
+            changed += connection.execute(
+                text("UPDATE jobapplication SET status = :target WHERE status = :status"),
+                {"target": target, "status": status},
+            ).rowcount
+    return changed
 
 
 def get_session():
@@ -0,0 +1,227 @@
+import codecs
+import csv
+import json
+import os
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlmodel import Session
+
+from .changes import record_changes
+from .database import engine
+from .models import (
+    ApplicationImportError, ApplicationImportReport, JobApplication, JobApplicationCreate,
+)
+from .stats import apply_counter_deltas, counter_deltas
+
+# Import configuration
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+# Longest line, and largest CSV record a quoted field may grow to
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES", "65536"))
+# Most lines a quoted field may run across
+IMPORT_MAX_RECORD_LINES = int(os.getenv("IMPORT_MAX_RECORD_LINES", "100"))
+
+# Marks the end of the lines in iter_csv_records
+_END = object()
+
+# Spreadsheet headers that mean one of our fields
+FIELD_ALIASES = {
+    "date": "date_applied",
+    "applied": "date_applied",
+    "applied_on": "date_applied",
+    "role": "position",
+    "title": "position",
+    "job_title": "position",
+    "employer": "company",
+}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[str]]:
+    """Decode a byte stream incrementally and yield it line by line
+
+    A line longer than IMPORT_MAX_RECORD_BYTES is skipped without being
+    held, and None is yielded in its place.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    skipping = False
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if skipping:
+                # The end of the line that was too long
+                skipping = False
+                continue
+            yield line
+        if len(pending) > IMPORT_MAX_RECORD_BYTES:
+            if not skipping:
+                yield None
+                skipping = True
+            pending = ""
+    pending += decoder.decode(b"", final=True)
+    if pending and not skipping:
+        yield pending
+
+
+async def _with_end(lines: AsyncIterator[Optional[str]]) -> AsyncIterator:
+    async for line in lines:
+        yield line
+    yield _END
+
+
+async def iter_csv_records(lines: AsyncIterator[Optional[str]]) -> AsyncIterator[Tuple[Optional[List[str]], Optional[str]]]:
+    # A record continues onto the next line while a quoted field is open,
+    # which is exactly when the record holds an odd number of quotes. One
+    # still open at the end of the body, or past IMPORT_MAX_RECORD_LINES
+    # lines or IMPORT_MAX_RECORD_BYTES, is almost always a stray quote: it
+    # is reported and reading resumes on the line after the one it opened on
+    parts: List[str] = []
+    quotes = size = 0
+    pending: Deque = deque()
+    async for item in _with_end(lines):
+        pending.append(item)
+        while pending:
+            line = pending.popleft()
+            if line is None or line is _END:
+                if parts:
+                    yield None, "Unterminated quoted field"
+                    pending.extendleft(reversed(parts[1:] + [line]))
+                    parts, quotes, size = [], 0, 0
+                elif line is None:
+                    yield None, f"Line over {IMPORT_MAX_RECORD_BYTES} bytes"
+                continue
+
+            parts.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                text = "\n".join(parts)
+                parts, quotes, size = [], 0, 0
+                if text.strip():
+                    yield next(csv.reader([text])), None
+                continue
+            size += len(line.encode()) + 1
+            if size > IMPORT_MAX_RECORD_BYTES or len(parts) > IMPORT_MAX_RECORD_LINES:
+                yield None, "Unterminated quoted field"
+                pending.extendleft(reversed(parts[1:]))
+                parts, quotes, size = [], 0, 0
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[Dict]:
+    """Yield one raw dict per CSV row (keyed by the header) or NDJSON line"""
+    lines = iter_lines(chunks)
+    if format == "ndjson":
+        async for line in lines:
+            if line is None:
+                yield {"__error__": f"Line over {IMPORT_MAX_RECORD_BYTES} bytes"}
+            elif line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield {"__error__": f"Invalid JSON: {e}"}
+        return
+
+    header = None
+    async for record, error in iter_csv_records(lines):
+        if error is not None:
+            yield {"__error__": error}
+            continue
+        if header is None:
+            header = [name.strip().lower().replace(" ", "_") for name in record]
+            continue
+        yield dict(zip(header, record))
+
+
+def normalize_row(row) -> Dict:
+    if not isinstance(row, dict):
+        raise ValueError("Each row must be an object")
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    data = {}
+    for key, value in row.items():
+        key = FIELD_ALIASES.get(key, key)
+        # Empty spreadsheet cells fall back to the model defaults
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+            # Spreadsheets usually carry plain dates
+            if key == "date_applied" and len(value) == 10:
+                value = f"{value}T00:00:00"
+        data[key] = value
+    return data
+
+
+def _validation_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+            for item in error.errors()
+        )
+    return str(error)
+
+
+def insert_batch(user_id: int, batch: List[Tuple[int, JobApplicationCreate]]) -> List[int]:
+    """Insert one batch in a single transaction and return the new ids"""
+    with Session(engine) as session:
+        applications = [
+            JobApplication.from_orm(application, update={"user_id": user_id})
+            for _, application in batch
+        ]
+        session.add_all(applications)
+        session.flush()
+        apply_counter_deltas(session, user_id, counter_deltas(added=applications))
+        record_changes(
+            session, user_id, [application.id for application in applications], "create")
+        session.commit()
+        return [application.id for application in applications]
+
+
+class ImportJob:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.report = ApplicationImportReport()
+        self.batch: List[Tuple[int, JobApplicationCreate]] = []
+
+    def fail(self, row_number: int, message: str):
+        self.report.failed += 1
+        if len(self.report.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.report.errors.append(
+                ApplicationImportError(row=row_number, error=message))
+        else:
+            self.report.errors_truncated = True
+
+    async def add(self, row_number: int, row):
+        try:
+            application = JobApplicationCreate.parse_obj(normalize_row(row))
+        except (ValidationError, ValueError) as e:
+            self.fail(row_number, _validation_message(e))
+            return
+        self.batch.append((row_number, application))
+        if len(self.batch) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        try:
+            await run_in_threadpool(insert_batch, self.user_id, batch)
+        except Exception as e:
+            for row_number, _ in batch:
+                self.fail(row_number, f"Database error: {e}")
+            return
+        self.report.imported += len(batch)
+
+
+async def import_applications(chunks: AsyncIterator[bytes], format: str, user_id: int) -> ApplicationImportReport:
+    job = ImportJob(user_id)
+    row_number = 0
+    async for row in iter_rows(chunks, format):
+        row_number += 1
+        await job.add(row_number, row)
+    await job.flush()
+    return job.report
@@ -1,11 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
+from sqlalchemy import and_, or_, update
 from typing import List, Optional
-
-from .models import JobApplication, JobApplicationCreate, JobApplicationUpdate, User
-from .database import create_db_and_tables, get_session
+from datetime import datetime
+import asyncio
+
+from .models import (
+    JobApplication, ArchivedJobApplication, JobApplicationCreate, JobApplicationUpdate, User,
+    ApplicationStats, ApplicationStatus, normalize_status,
+    JobApplicationBulkUpdate, JobApplicationBulkResult, ApplicationChangeFeed,
+    ApplicationImportReport,
+)
+from .database import create_db_and_tables, get_session, engine, migrate_status_values
 from .auth import get_current_user, authenticate_user, UserLogin
 from .middleware import UserAgentMiddleware
+from .stats import apply_counter_deltas, counter_deltas, ensure_counters, get_application_stats, rebuild_counters
+from .search import text_search_filter
+from .pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from .archive import ARCHIVE_INTERVAL_SECONDS, get_application, read_applications, run_archiver
+from .changes import changes_since, record_changes, stream_changes
+from .importer import import_applications
 
 # Create FastAPI app
 app = FastAPI(title="Career Tracker API", version="1.0.0")
@@ -19,6 +34,31 @@ app.add_middleware(UserAgentMiddleware)
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    statuses_changed = migrate_status_values()
+    with Session(engine) as session:
+        if statuses_changed:
+            rebuild_counters(session)
+        else:
+            ensure_counters(session)
+
+
+archiver_task = None
+
+# Upper bound on ids per bulk update, which keeps IN lists a sane size
+MAX_BULK_UPDATE = 1000
+
+
+@app.on_event("startup")
+async def start_archiver():
+    global archiver_task
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        archiver_task = asyncio.create_task(run_archiver())
+
+
+@app.on_event("shutdown")
+async def stop_archiver():
+    if archiver_task:
+        archiver_task.cancel()
 
 # Authentication endpoint
 
@@ -42,68 +82,261 @@ def create_job_application(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    db_application = JobApplication.from_orm(application)
-    db_application.user_id = current_user.id
+    db_application = JobApplication.from_orm(
+        application, update={"user_id": current_user.id})
     session.add(db_application)
+    session.flush()
+    apply_counter_deltas(session, current_user.id,
+                         counter_deltas(added=[db_application]))
+    record_changes(session, current_user.id, [db_application.id], "create")
     session.commit()
     session.refresh(db_application)
     return db_application
 
 
+@app.post("/applications/import", response_model=ApplicationImportReport)
+async def import_job_applications(
+    request: Request,
+    format: Optional[str] = Query(
+        None, regex="^(csv|ndjson)$",
+        description="Body format; defaults from the Content-Type header"),
+    current_user: User = Depends(get_current_user)
+):
+    # The body is parsed as it arrives and written in batched transactions
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    return await import_applications(request.stream(), format, current_user.id)
+
+
 @app.get("/applications/", response_model=List[JobApplication])
 def get_job_applications(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    applied_after: Optional[datetime] = Query(
+        None, description="Only applications applied on or after this time"),
+    applied_before: Optional[datetime] = Query(
+        None, description="Only applications applied before this time"),
+    cursor: Optional[str] = Query(
+        None, description="Cursor from the X-Next-Cursor response header"),
+    include_archived: bool = Query(
+        False, description="Also return archived applications"),
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    applications = session.exec(
-        select(JobApplication)
-        .where(JobApplication.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-    ).all()
+    if cursor:
+        last_date, last_id = decode_cursor(cursor, datetime, int)
+
+    # Newest first, served by the (user_id, date_applied, id) index
+    def filters(model):
+        clauses = [model.user_id == current_user.id]
+        if applied_after:
+            clauses.append(model.date_applied >= applied_after)
+        if applied_before:
+            clauses.append(model.date_applied < applied_before)
+        if cursor:
+            clauses.append(or_(
+                model.date_applied < last_date,
+                and_(model.date_applied == last_date, model.id < last_id),
+            ))
+        return clauses
+
+    def order_by(model):
+        return [model.date_applied.desc(), model.id.desc()]
+
+    applications = read_applications(
+        session, filters, order_by, limit, skip=skip,
+        include_archived=include_archived)
+
+    if applications and len(applications) == limit:
+        last = applications[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            last.date_applied, last.id)
     return applications
 
 
-@app.get("/applications/search", response_model=List[JobApplication])
-def search_job_applications(
-    status: Optional[str] = Query(
-        None, description="Filter by application status"),
-    company: Optional[str] = Query(None, description="Filter by company name"),
-    position: Optional[str] = Query(None, description="Filter by position"),
+@app.patch("/applications/", response_model=List[JobApplicationBulkResult])
+def bulk_update_job_applications(
+    bulk: JobApplicationBulkUpdate,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    try:
-        query = select(JobApplication).where(
-            JobApplication.user_id == current_user.id)
+    # Collect the requested changes per id
+    requested = {}
+    shared = bulk.changes.dict(exclude_unset=True, exclude_none=True) if bulk.changes else {}
+    for application_id in bulk.ids:
+        requested.setdefault(application_id, []).append(shared)
+    for item in bulk.items:
+        requested.setdefault(item.id, []).append(
+            item.changes.dict(exclude_unset=True, exclude_none=True))
+
+    duplicates = [application_id for application_id,
+                  changes in requested.items() if len(changes) > 1]
+    if duplicates:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Each application may appear only once: {duplicates}"
+        )
+    if len(requested) > MAX_BULK_UPDATE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_UPDATE} applications per request"
+        )
 
-        if status:
-            # Validate status
-            valid_statuses = ["pending", "interview", "rejected", "accepted"]
-            if status.lower() not in valid_statuses:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
-                )
-            query = query.where(JobApplication.status.ilike(f"%{status}%"))
+    # Ownership-filtered read of the current rows, archived ones included;
+    # ids that are missing or belong to someone else are reported the same way
+    owned = {}
+    tables = {}
+    for model in (JobApplication, ArchivedJobApplication):
+        for application in session.exec(
+            select(model).where(
+                model.user_id == current_user.id,
+                model.id.in_(list(requested)),
+            )
+        ):
+            owned[application.id] = JobApplication.from_orm(application)
+            tables[application.id] = model
+
+    # One UPDATE per distinct change set and table
+    change_sets = {}
+    for application_id, (changes,) in requested.items():
+        if application_id in owned and changes:
+            key = (tables[application_id], tuple(sorted(changes.items())))
+            change_sets.setdefault(key, []).append(application_id)
+
+    updated = {}
+    for (model, key), ids in change_sets.items():
+        changes = dict(key)
+        session.exec(
+            update(model)
+            .where(model.user_id == current_user.id,
+                   model.id.in_(ids))
+            .values(**changes)
+            .execution_options(synchronize_session=False)
+        )
+        for application_id in ids:
+            updated[application_id] = owned[application_id].copy(update=changes)
 
-        if company:
-            query = query.where(JobApplication.company.ilike(f"%{company}%"))
+    apply_counter_deltas(session, current_user.id, counter_deltas(
+        added=updated.values(),
+        removed=[owned[application_id] for application_id in updated]))
+    record_changes(session, current_user.id, updated, "update")
+    session.commit()
 
-        if position:
-            query = query.where(JobApplication.position.ilike(f"%{position}%"))
+    results = []
+    for application_id in requested:
+        if application_id not in owned:
+            results.append(JobApplicationBulkResult(
+                id=application_id, result="not_found"))
+        elif application_id in updated:
+            results.append(JobApplicationBulkResult(
+                id=application_id, result="updated",
+                application=updated[application_id]))
+        else:
+            results.append(JobApplicationBulkResult(
+                id=application_id, result="unchanged",
+                application=owned[application_id]))
+    return results
+
+
+@app.get("/applications/stats", response_model=ApplicationStats)
+def get_job_application_stats(
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    return get_application_stats(session, current_user.id)
+
+
+@app.get("/applications/changes", response_model=ApplicationChangeFeed)
+def get_job_application_changes(
+    since: int = Query(0, ge=0, description="Last change seq already seen"),
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    return changes_since(session, current_user.id, since, limit)
+
+
+@app.get("/applications/changes/stream")
+def stream_job_application_changes(
+    request: Request,
+    since: Optional[int] = Query(
+        None, ge=0, description="Last change seq already seen"),
+    current_user: User = Depends(get_current_user)
+):
+    # EventSource reconnects send the last event id they received
+    if since is None:
+        last_event_id = request.headers.get("last-event-id", "0")
+        since = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        stream_changes(request, current_user.id, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        applications = session.exec(query).all()
-        return applications
 
+@app.get("/applications/search", response_model=List[JobApplication])
+def search_job_applications(
+    response: Response,
+    status: Optional[str] = Query(
+        None, description="Filter by application status"),
+    company: Optional[str] = Query(
+        None, description="Filter by company name (word prefixes)"),
+    position: Optional[str] = Query(
+        None, description="Filter by position (word prefixes)"),
+    cursor: Optional[str] = Query(
+        None, description="Cursor from the X-Next-Cursor response header"),
+    limit: int = Query(100, ge=1, le=500),
+    include_archived: bool = Query(
+        False, description="Also search archived applications"),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    status_value = None
+    if status:
+        # Validate status
+        try:
+            status_value = ApplicationStatus(normalize_status(status))
+        except ValueError:
+            valid_statuses = [member.value for member in ApplicationStatus]
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
+            )
+
+    last_id = decode_cursor(cursor, int)[0] if cursor else None
+    dialect = session.get_bind().dialect.name
+
+    def filters(model):
+        clauses = [model.user_id == current_user.id]
+        if status_value:
+            clauses.append(model.status == status_value)
+        text_filter = text_search_filter(
+            dialect, model.__table__, company=company, position=position)
+        if text_filter is not None:
+            clauses.append(text_filter)
+        if last_id is not None:
+            clauses.append(model.id < last_id)
+        return clauses
+
+    def order_by(model):
+        return [model.id.desc()]
+
+    try:
+        applications = read_applications(
+            session, filters, order_by, limit,
+            include_archived=include_archived)
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=500,
             detail=f"Error processing search query: {str(e)}"
         )
 
+    if len(applications) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(applications[-1].id)
+    return applications
+
 
 @app.get("/applications/{application_id}", response_model=JobApplication)
 def get_job_application(
@@ -111,7 +344,7 @@ def get_job_application(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    application = session.get(JobApplication, application_id)
+    application = get_application(session, application_id)
     if not application:
         raise HTTPException(
             status_code=404, detail="Job application not found")
@@ -133,7 +366,7 @@ def update_job_application(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    db_application = session.get(JobApplication, application_id)
+    db_application = get_application(session, application_id)
     if not db_application:
         raise HTTPException(
             status_code=404, detail="Job application not found")
@@ -145,11 +378,15 @@ def update_job_application(
             detail="Not authorized to update this application"
         )
 
+    previous = JobApplication.from_orm(db_application)
     application_data = application.dict(exclude_unset=True)
     for key, value in application_data.items():
         setattr(db_application, key, value)
 
     session.add(db_application)
+    apply_counter_deltas(session, current_user.id, counter_deltas(
+        added=[db_application], removed=[previous]))
+    record_changes(session, current_user.id, [application_id], "update")
     session.commit()
     session.refresh(db_application)
     return db_application
@@ -161,7 +398,7 @@ def delete_job_application(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    application = session.get(JobApplication, application_id)
+    application = get_application(session, application_id)
     if not application:
         raise HTTPException(
             status_code=404, detail="Job application not found")
@@ -174,6 +411,9 @@ def delete_job_application(
         )
 
     session.delete(application)
+    apply_counter_deltas(session, current_user.id,
+                         counter_deltas(removed=[application]))
+    record_changes(session, current_user.id, [application_id], "delete")
     session.commit()
     return {"message": "Job application deleted successfully"}
 
@@ -1,17 +1,44 @@
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Iterable, Optional
 
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-class UserAgentMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        user_agent = request.headers.get("user-agent")
 
-        if not user_agent:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="User-Agent header is required"
-            )
+class HeaderPolicyMiddleware:
+    """Reject HTTP requests that are missing any of the required headers
 
-        # Process request
-        response = await call_next(request)
-        return response
+    Runs as plain ASGI: the headers in the scope are checked once and a
+    rejected request is answered directly, without ever reaching the app.
+    """
+
+    def __init__(self, app: ASGIApp, required_headers: Iterable[str] = ("user-agent",)):
+        self.app = app
+        # ASGI header names are lowercase byte strings
+        self.required_headers = tuple(
+            (name.lower().encode("latin-1"), name) for name in required_headers
+        )
+
+    def missing_header(self, scope: Scope) -> Optional[str]:
+        present = {name for name, value in scope["headers"] if value}
+        for raw_name, name in self.required_headers:
+            if raw_name not in present:
+                return name
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            missing = self.missing_header(scope)
+            if missing is not None:
+                response = JSONResponse(
+                    {"detail": f"{missing} header is required"},
+                    status_code=400,
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class UserAgentMiddleware(HeaderPolicyMiddleware):
+    def __init__(self, app: ASGIApp):
+        super().__init__(app, required_headers=("User-Agent",))
@@ -1,24 +1,76 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from sqlalchemy import Index
+from typing import Optional, Dict, List
 from datetime import datetime
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, validator
 
 # Job Application Models
 
 
+class ApplicationStatus(str, Enum):
+    pending = "pending"
+    interview = "interview"
+    rejected = "rejected"
+    accepted = "accepted"
+
+
+# Common spellings from spreadsheets and other trackers
+STATUS_ALIASES = {
+    "applied": "pending",
+    "submitted": "pending",
+    "interviewing": "interview",
+    "offer": "accepted",
+    "offered": "accepted",
+    "declined": "rejected",
+}
+
+
+def normalize_status(value):
+    if isinstance(value, str):
+        value = value.strip().lower()
+        return STATUS_ALIASES.get(value, value)
+    return value
+
+
 class JobApplicationBase(SQLModel):
     company: str
     position: str
-    # pending, interview, rejected, accepted
-    status: str = Field(default="pending")
+    status: ApplicationStatus = Field(default=ApplicationStatus.pending)
     date_applied: datetime = Field(default_factory=datetime.now)
 
+    _normalize_status = validator(
+        "status", pre=True, allow_reuse=True)(normalize_status)
+
 
 class JobApplication(JobApplicationBase, table=True):
+    # Search filters by user first, then exact status, newest id first;
+    # listing walks a user's timeline newest first
+    __table_args__ = (
+        Index("ix_jobapplication_user_status_id", "user_id", "status", "id"),
+        Index("ix_jobapplication_user_date_id", "user_id", "date_applied", "id"),
+        # Archived rows keep their id, so SQLite must never reuse one
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
 
 
+class ArchivedJobApplication(JobApplicationBase, table=True):
+    # Same shape and indexes as JobApplication, plus when the row moved here
+    __table_args__ = (
+        Index("ix_archivedjobapplication_user_status_id",
+              "user_id", "status", "id"),
+        Index("ix_archivedjobapplication_user_date_id",
+              "user_id", "date_applied", "id"),
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    user_id: int = Field(foreign_key="user.id")
+    archived_at: datetime = Field(default_factory=datetime.now)
+
+
 class JobApplicationCreate(JobApplicationBase):
     pass
 
@@ -26,9 +78,98 @@ class JobApplicationCreate(JobApplicationBase):
 class JobApplicationUpdate(SQLModel):
     company: Optional[str] = None
     position: Optional[str] = None
-    status: Optional[str] = None
+    status: Optional[ApplicationStatus] = None
     date_applied: Optional[datetime] = None
 
+    _normalize_status = validator(
+        "status", pre=True, allow_reuse=True)(normalize_status)
+
+
+class JobApplicationBulkItem(SQLModel):
+    id: int
+    changes: JobApplicationUpdate
+
+
+class JobApplicationBulkUpdate(SQLModel):
+    # Either the same changes for every id in ids, per-id items, or both
+    ids: List[int] = []
+    changes: Optional[JobApplicationUpdate] = None
+    items: List[JobApplicationBulkItem] = []
+
+
+class JobApplicationBulkResult(SQLModel):
+    id: int
+    result: str  # updated, unchanged or not_found
+    application: Optional[JobApplication] = None
+
+# Import Models
+
+
+class ApplicationImportError(SQLModel):
+    row: int
+    error: str
+
+
+class ApplicationImportReport(SQLModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[ApplicationImportError] = []
+    # Only the first errors are listed; failed has the full count
+    errors_truncated: bool = False
+
+# Change Feed Models
+
+
+class ApplicationChange(SQLModel, table=True):
+    # seq only ever grows, so clients can ask for everything after the last
+    # one they saw
+    __table_args__ = (
+        Index("ix_applicationchange_user_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    application_id: int
+    op: str  # create, update, delete, archive
+    changed_at: datetime = Field(default_factory=datetime.now)
+
+
+class ApplicationChangeRead(SQLModel):
+    seq: int
+    application_id: int
+    op: str
+    changed_at: datetime
+    # Current state of the application, archived or not; None once deleted
+    application: Optional[JobApplication] = None
+
+
+class ApplicationChangeFeed(SQLModel):
+    changes: List[ApplicationChangeRead]
+    last_seq: int
+    has_more: bool
+    # The requested position was pruned; reload the full list
+    resync_required: bool = False
+
+# Pipeline Statistics Models
+
+
+class ApplicationCounter(SQLModel, table=True):
+    # One row per (user, dimension, key), e.g. ("status", "interview") or
+    # ("week", "2024-W07"); kept in step with JobApplication writes
+    user_id: int = Field(primary_key=True)
+    dimension: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class ApplicationStats(SQLModel):
+    total: int
+    by_status: Dict[str, int]
+    by_company: Dict[str, int]
+    per_week: Dict[str, int]
+    conversion_rates: Dict[str, float]
+
 # User Models for Authentication
 
 
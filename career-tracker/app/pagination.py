@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+from fastapi import HTTPException, status
+
+# Keyset cursors are the sort-key values of the last row on a page, packed
+# into an opaque URL-safe token and returned in the X-Next-Cursor header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, default=_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _parse(value: Any, kind: type) -> Any:
+    if kind is datetime:
+        return datetime.fromisoformat(value) if isinstance(value, str) else None
+    # bool is an int too, but never a valid key
+    if kind is int:
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    return value if isinstance(value, kind) else None
+
+
+def decode_cursor(cursor: str, *kinds: type) -> List[Any]:
+    """The values packed by encode_cursor, checked against kinds (int, datetime or str)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(values, list) and len(values) == len(kinds):
+            values = [_parse(value, kind) for value, kind in zip(values, kinds)]
+        else:
+            values = None
+    except (ValueError, TypeError):
+        values = None
+
+    if values is None or any(value is None for value in values):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+    return values
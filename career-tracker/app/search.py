@@ -0,0 +1,108 @@
+import re
+from typing import List, Optional
+
+from sqlalchemy import and_, column, func, text
+from sqlalchemy.engine import Engine
+
+# Company/position search runs against a full-text index instead of
+# ilike('%...%') scans: an FTS5 table kept in sync by triggers on SQLite, and
+# GIN expression indexes on PostgreSQL. Every query term is a word prefix.
+SEARCH_COLUMNS = ("company", "position")
+TS_CONFIG = "simple"
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+def _install_sqlite(connection, table: str):
+    fts = _fts_table(table)
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": fts},
+    ).first()
+
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{name}" for name in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{name}" for name in SEARCH_COLUMNS)
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{columns}, content='{table}', content_rowid='id', tokenize='unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+    # Index rows that were written before the FTS table existed
+    if not exists:
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _install_postgresql(connection, table: str):
+    for name in SEARCH_COLUMNS:
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_{name}_fts ON {table} "
+            f"USING gin (to_tsvector('{TS_CONFIG}', {name}))"
+        ))
+
+
+def install_search_index(engine: Engine, table: str):
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            _install_sqlite(connection, table)
+        elif engine.dialect.name == "postgresql":
+            _install_postgresql(connection, table)
+
+
+def search_terms(value: Optional[str]) -> List[str]:
+    return _TERM_RE.findall(value.lower()) if value else []
+
+
+def text_search_filter(dialect: str, table, **fields: Optional[str]):
+    """Build a WHERE clause matching each given column by word prefixes
+
+    Returns None when no field carries a searchable term.
+    """
+    terms = {name: search_terms(value) for name, value in fields.items()}
+    terms = {name: words for name, words in terms.items() if words}
+    if not terms:
+        return None
+
+    if dialect == "sqlite":
+        fts = _fts_table(table.name)
+        expression = " AND ".join(
+            f"{name} : (" + " AND ".join(f'"{word}"*' for word in words) + ")"
+            for name, words in terms.items()
+        )
+        matches = text(
+            f"SELECT rowid FROM {fts} WHERE {fts} MATCH :expression"
+        ).bindparams(expression=expression).columns(column("rowid"))
+        return table.c.id.in_(matches)
+
+    if dialect == "postgresql":
+        clauses = [
+            func.to_tsvector(TS_CONFIG, table.c[name]).op("@@")(
+                func.to_tsquery(TS_CONFIG, " & ".join(f"{word}:*" for word in words))
+            )
+            for name, words in terms.items()
+        ]
+        return and_(*clauses)
+
+    # Other databases fall back to an unindexed word-prefix match
+    clauses = []
+    for name, words in terms.items():
+        lowered = func.lower(table.c[name])
+        for word in words:
+            clauses.append(
+                lowered.like(f"{word}%") | lowered.like(f"% {word}%"))
+    return and_(*clauses)
@@ -0,0 +1,157 @@
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from .models import ApplicationCounter, ApplicationStats, ArchivedJobApplication, JobApplication
+
+CounterKey = Tuple[str, str]
+
+
+def status_key(value) -> str:
+    # Accepts both plain strings and enum members
+    return str(getattr(value, "value", value)).lower()
+
+
+def week_key(date_applied) -> str:
+    year, week, _ = date_applied.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def counter_keys(application) -> Tuple[CounterKey, ...]:
+    return (
+        ("status", status_key(application.status)),
+        ("company", application.company),
+        ("week", week_key(application.date_applied)),
+    )
+
+
+def counter_deltas(added: Iterable = (), removed: Iterable = ()) -> Dict[CounterKey, int]:
+    """Net counter changes for applications being added and/or removed"""
+    deltas = Counter()
+    for application in added:
+        deltas.update(counter_keys(application))
+    for application in removed:
+        deltas.subtract(counter_keys(application))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_counter_deltas(session: Session, user_id: int, deltas: Dict[CounterKey, int]):
+    # Runs inside the caller's transaction, so counters commit (or roll back)
+    # together with the application rows they describe
+    insert = _upsert_insert(session)
+    increments = []
+    for (dimension, key), delta in deltas.items():
+        if delta > 0 and insert is not None:
+            increments.append(
+                {"user_id": user_id, "dimension": dimension, "key": key, "count": delta})
+            continue
+        result = session.exec(
+            update(ApplicationCounter)
+            .where(
+                ApplicationCounter.user_id == user_id,
+                ApplicationCounter.dimension == dimension,
+                ApplicationCounter.key == key,
+            )
+            .values(count=ApplicationCounter.count + delta)
+        )
+        if result.rowcount == 0 and delta > 0:
+            session.add(ApplicationCounter(
+                user_id=user_id, dimension=dimension, key=key, count=delta
+            ))
+
+    if increments:
+        # INSERT ... ON CONFLICT DO UPDATE, so two first writes to the same
+        # counter can't both try to insert it
+        statement = insert(ApplicationCounter)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "dimension", "key"],
+                set_={"count": ApplicationCounter.count + statement.excluded.count},
+            ),
+            increments,
+        )
+
+
+def _upsert_insert(session: Session):
+    # Dialect insert() that supports ON CONFLICT, or None
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert
+    if dialect == "postgresql":
+        return postgresql_insert
+    return None
+
+
+def rebuild_counters(session: Session):
+    """Recompute every counter from the applications (one full pass)
+
+    Archived applications still count, as they do in the live counters.
+    """
+    session.exec(ApplicationCounter.__table__.delete())
+    totals: Dict[int, Counter] = {}
+    for model in (JobApplication, ArchivedJobApplication):
+        rows = session.exec(
+            select(model).execution_options(yield_per=1000)
+        )
+        for application in rows:
+            totals.setdefault(application.user_id, Counter()).update(
+                counter_keys(application))
+
+    for user_id, counts in totals.items():
+        for (dimension, key), count in counts.items():
+            session.add(ApplicationCounter(
+                user_id=user_id, dimension=dimension, key=key, count=count
+            ))
+    session.commit()
+
+
+def ensure_counters(session: Session):
+    # Databases created before counters existed need a one-off backfill
+    has_counters = session.exec(select(ApplicationCounter).limit(1)).first()
+    has_applications = any(
+        session.exec(select(model.id).limit(1)).first() is not None
+        for model in (JobApplication, ArchivedJobApplication)
+    )
+    if has_applications and has_counters is None:
+        rebuild_counters(session)
+
+
+def _rate(numerator: int, denominator: int) -> float:
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+
+def get_application_stats(session: Session, user_id: int) -> ApplicationStats:
+    counters = session.exec(
+        select(ApplicationCounter).where(
+            ApplicationCounter.user_id == user_id,
+            ApplicationCounter.count > 0,
+        )
+    ).all()
+
+    grouped: Dict[str, Dict[str, int]] = {"status": {}, "company": {}, "week": {}}
+    for counter in counters:
+        grouped.setdefault(counter.dimension, {})[counter.key] = counter.count
+
+    by_status = grouped["status"]
+    total = sum(by_status.values())
+    interview = by_status.get("interview", 0)
+    accepted = by_status.get("accepted", 0)
+
+    # Funnel is pending -> interview -> accepted; an accepted application is
+    # counted as having passed the interview stage
+    return ApplicationStats(
+        total=total,
+        by_status=by_status,
+        by_company=dict(sorted(
+            grouped["company"].items(), key=lambda item: (-item[1], item[0]))),
+        per_week=dict(sorted(grouped["week"].items())),
+        conversion_rates={
+            "pending_to_interview": _rate(interview + accepted, total),
+            "interview_to_accepted": _rate(accepted, interview + accepted),
+            "pending_to_accepted": _rate(accepted, total),
+        },
+    )
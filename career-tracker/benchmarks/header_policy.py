@@ -0,0 +1,97 @@
+"""Compare the pure-ASGI header policy with the old BaseHTTPMiddleware version
+
+Run from the career-tracker directory:
+
+    python -m benchmarks.header_policy [requests]
+
+Each request goes straight through the middleware into a tiny ASGI app, so
+the numbers isolate middleware overhead from routing and the database.
+"""
+import asyncio
+import sys
+import time
+
+from fastapi import HTTPException, Request, status
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+
+from app.middleware import UserAgentMiddleware
+
+
+class LegacyUserAgentMiddleware(BaseHTTPMiddleware):
+    # The implementation this middleware replaced
+    async def dispatch(self, request: Request, call_next):
+        user_agent = request.headers.get("user-agent")
+
+        if not user_agent:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User-Agent header is required"
+            )
+
+        response = await call_next(request)
+        return response
+
+
+async def endpoint(scope, receive, send):
+    await PlainTextResponse("ok")(scope, receive, send)
+
+
+def make_scope():
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/applications/",
+        "raw_path": b"/applications/",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"user-agent", b"bench/1.0"),
+            (b"accept", b"application/json"),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8002),
+    }
+
+
+def make_receive():
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Nothing more to read: the client hangs up once it has its response
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(make_scope(), make_receive(), send)
+    return time.perf_counter() - started
+
+
+async def main(requests: int):
+    candidates = [
+        ("BaseHTTPMiddleware (old)", LegacyUserAgentMiddleware(endpoint)),
+        ("pure ASGI (new)", UserAgentMiddleware(endpoint)),
+    ]
+    for name, app in candidates:
+        await run(app, 200)  # warm up
+        elapsed = await run(app, requests)
+        print(f"{name:<26} {requests / elapsed:>10.0f} req/s  "
+              f"{elapsed / requests * 1e6:>7.1f} us/req")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
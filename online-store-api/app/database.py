@@ -1,11 +1,13 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel, Session
 import os
 
+from .engine import build_engine
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./store.db")
 
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = build_engine(DATABASE_URL)
 
 
 def create_db_and_tables():
@@ -0,0 +1,285 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from mimetypes import guess_type
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from .database import engine
+from .models import Note, NoteAttachment
+
+try:
+    import fcntl
+except ImportError:  # Windows: blobs are then only safe within one process
+    fcntl = None
+
+# Attachment configuration
+ATTACHMENTS_DIR = os.getenv("NOTES_ATTACHMENTS_DIR", "attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("NOTES_ATTACHMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+ATTACHMENT_CACHE_SECONDS = int(os.getenv("NOTES_ATTACHMENT_CACHE_SECONDS", "86400"))
+
+# Types a browser may show in place; anything else is always downloaded
+INLINE_MEDIA_PREFIXES = ("image/", "audio/", "video/", "application/pdf", "text/plain")
+
+MEDIA_TYPE_RE = re.compile(r"^[\w.+-]+/[\w.+-]+$")
+
+# flock doesn't exclude threads of one process; this does
+_blob_thread_lock = threading.Lock()
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+@contextmanager
+def blob_lock():
+    """Held while blobs are put in place or removed, across threads and workers
+
+    An upload finds a file with its hash already there and drops its own
+    copy; without the lock, release_blobs could delete that file between
+    the check and the new attachment row being committed.
+    """
+    os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+    with _blob_thread_lock:
+        fd = os.open(os.path.join(ATTACHMENTS_DIR, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor drops the flock
+            os.close(fd)
+
+
+async def receive_blob(chunks: AsyncIterator[bytes]) -> Tuple[str, int, str]:
+    """Stream an upload to a temp file and return (sha256, size, temp path)
+
+    add_attachment moves the file into place; the temp file is removed
+    here only if the upload fails.
+    """
+    temp_dir = os.path.join(ATTACHMENTS_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with anyio.wrap_file(os.fdopen(fd, "wb")) as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge()
+                digest.update(chunk)
+                await f.write(chunk)
+        return digest.hexdigest(), size, temp_path
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def upload_media_type(content_type: Optional[str], filename: str) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    # Clients that don't set one usually send the form default
+    if not MEDIA_TYPE_RE.match(media_type) or media_type == "application/x-www-form-urlencoded":
+        media_type = guess_type(filename)[0] or "application/octet-stream"
+    return media_type
+
+
+def note_exists(note_id: int) -> bool:
+    with Session(engine) as session:
+        return session.get(Note, note_id) is not None
+
+
+def add_attachment(note_id: int, filename: str, media_type: str, sha256: str, size: int,
+                   temp_path: str) -> Optional[NoteAttachment]:
+    """Put an uploaded blob in place and commit its attachment row
+
+    Both happen under blob_lock, so the blob can't be released in between.
+    The temp file is always gone afterwards. Returns None if the note no
+    longer exists.
+    """
+    try:
+        with blob_lock(), Session(engine) as session:
+            if session.get(Note, note_id) is None:
+                return None
+            path = blob_path(sha256)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+            attachment = NoteAttachment(
+                note_id=note_id, filename=filename, media_type=media_type,
+                sha256=sha256, size=size)
+            session.add(attachment)
+            session.commit()
+            session.refresh(attachment)
+            return attachment
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def delete_note_attachments(session: Session, note_id: int) -> list:
+    """Delete a note's attachment rows; returns their hashes for release_blobs"""
+    hashes = session.exec(
+        select(NoteAttachment.sha256).where(NoteAttachment.note_id == note_id)
+    ).all()
+    session.exec(delete(NoteAttachment).where(NoteAttachment.note_id == note_id))
+    return hashes
+
+
+def release_blobs(hashes: Iterable[str]):
+    """Remove the files no attachment refers to any more; call after commit"""
+    with blob_lock(), Session(engine) as session:
+        for sha256 in set(hashes):
+            in_use = session.exec(
+                select(NoteAttachment.id).where(NoteAttachment.sha256 == sha256).limit(1)
+            ).first()
+            if in_use is None:
+                try:
+                    os.remove(blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single "bytes=" range
+
+    Returns None for headers that should be ignored (other units, several
+    ranges, bad syntax), which means sending the whole file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in [
+        value[2:] if value.startswith("W/") else value for value in candidates
+    ]
+
+
+class AttachmentResponse(FileResponse):
+    """FileResponse that sends one byte range of the file
+
+    Uses the ASGI zero-copy send extension (os.sendfile in the server) when
+    the server offers it, and plain chunked reads otherwise.
+    """
+
+    def __init__(self, path: str, byte_range: Tuple[int, int], **kwargs):
+        super().__init__(path, **kwargs)
+        self.byte_range = byte_range
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        start, end = self.byte_range
+        remaining = end - start + 1
+        if self.send_header_only or remaining <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": start,
+                    "count": remaining,
+                    "more_body": False,
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    })
+                if remaining > 0:
+                    # File shrank underneath us; end the body anyway
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def attachment_response(request: Request, attachment: NoteAttachment) -> Response:
+    # Content-addressed, so the hash is a strong validator
+    etag = f'"{attachment.sha256}"'
+    headers = {
+        "etag": etag,
+        "accept-ranges": "bytes",
+        "cache-control": f"private, max-age={ATTACHMENT_CACHE_SECONDS}",
+        "x-content-type-options": "nosniff",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = attachment.size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+    if byte_range is None:
+        status_code, byte_range = 200, (0, size - 1)
+    else:
+        status_code = 206
+        headers["content-range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+    headers["content-length"] = str(byte_range[1] - byte_range[0] + 1)
+
+    inline = attachment.media_type.startswith(INLINE_MEDIA_PREFIXES)
+    return AttachmentResponse(
+        blob_path(attachment.sha256),
+        byte_range,
+        status_code=status_code,
+        headers=headers,
+        media_type=attachment.media_type,
+        filename=attachment.filename,
+        method=request.method,
+        content_disposition_type="inline" if inline else "attachment",
+    )
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import List
+
+from sqlmodel import Session, select
+
+from .database import engine
+from .models import Note
+
+# Backup configuration
+BACKUP_FILE = os.getenv("NOTES_BACKUP_FILE", "notes.json")
+JOURNAL_FILE = os.getenv("NOTES_BACKUP_JOURNAL", "notes.journal")
+# Quiet period before queued changes are appended to the journal
+BACKUP_DEBOUNCE_SECONDS = float(os.getenv("NOTES_BACKUP_DEBOUNCE_SECONDS", "2"))
+# Longest a steady stream of changes can hold the journal back
+BACKUP_MAX_DELAY_SECONDS = float(os.getenv("NOTES_BACKUP_MAX_DELAY_SECONDS", "30"))
+# The journal is folded into a fresh snapshot after this long or this many changes
+BACKUP_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("NOTES_BACKUP_SNAPSHOT_INTERVAL_SECONDS", "300"))
+BACKUP_SNAPSHOT_AFTER_CHANGES = int(os.getenv("NOTES_BACKUP_SNAPSHOT_AFTER_CHANGES", "1000"))
+
+logger = logging.getLogger("backup")
+
+
+def note_record(note: Note) -> dict:
+    return {
+        "id": note.id,
+        "title": note.title,
+        "content": note.content,
+        "created_at": note.created_at.isoformat()
+    }
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+class BackupWriter:
+    """Write-behind backup: a change journal plus periodic snapshots
+
+    Request handlers only queue changes in memory. A worker thread appends
+    them to the journal once writes go quiet, and from time to time writes
+    a snapshot of every note (to a temp file renamed over notes.json) and
+    drops the journal entries the snapshot covers. The snapshot plus the
+    journal is always a complete backup.
+    """
+
+    def __init__(self):
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._journaled = 0
+        self._last_snapshot = time.monotonic()
+
+    def record_upsert(self, note: Note):
+        self._queue({"op": "upsert", "note": note_record(note)})
+
+    def record_delete(self, note_id: int):
+        self._queue({"op": "delete", "id": note_id})
+
+    def _queue(self, entry: dict):
+        with self._lock:
+            self._pending.append(_dumps(entry))
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="notes-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        if not os.path.exists(BACKUP_FILE):
+            self._safely(self.snapshot)
+
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=BACKUP_SNAPSHOT_INTERVAL_SECONDS)
+            if self._wakeup.is_set():
+                self._settle()
+            self._wakeup.clear()
+            self._safely(self.flush_journal)
+
+            snapshot_due = (
+                self._journaled >= BACKUP_SNAPSHOT_AFTER_CHANGES
+                or (self._journaled and time.monotonic() - self._last_snapshot
+                    >= BACKUP_SNAPSHOT_INTERVAL_SECONDS)
+            )
+            if snapshot_due:
+                self._safely(self.snapshot)
+
+        self._safely(self.flush_journal)
+        if self._journaled:
+            self._safely(self.snapshot)
+
+    def _settle(self):
+        # Debounce: wait until no change has been queued for
+        # BACKUP_DEBOUNCE_SECONDS, so a burst of writes touches disk once
+        deadline = time.monotonic() + BACKUP_MAX_DELAY_SECONDS
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._wakeup.wait(min(BACKUP_DEBOUNCE_SECONDS, remaining)):
+                return
+
+    def _safely(self, step):
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Error backing up notes: {e}")
+
+    def flush_journal(self):
+        with self._lock:
+            entries, self._pending = self._pending, []
+        if not entries:
+            return
+        with open(JOURNAL_FILE, "a") as f:
+            f.write("\n".join(entries) + "\n")
+        self._journaled += len(entries)
+
+    def snapshot(self):
+        # Everything journaled so far was committed before the rotation, so
+        # the snapshot read below covers it and the old journal can go
+        self.flush_journal()
+        rotated = f"{JOURNAL_FILE}.old"
+        if os.path.exists(JOURNAL_FILE):
+            if os.path.exists(rotated):
+                # A previous snapshot failed; keep its entries too
+                with open(JOURNAL_FILE) as src, open(rotated, "a") as dst:
+                    for line in src:
+                        dst.write(line)
+                os.remove(JOURNAL_FILE)
+            else:
+                os.replace(JOURNAL_FILE, rotated)
+        self._journaled = 0
+
+        # A temp file of our own, so workers snapshotting at once don't
+        # write into each other's file
+        f = tempfile.NamedTemporaryFile(
+            "w", dir=os.path.dirname(BACKUP_FILE) or ".",
+            prefix=f"{os.path.basename(BACKUP_FILE)}.", suffix=".tmp", delete=False)
+        try:
+            with Session(engine) as session, f:
+                f.write("[")
+                notes = session.exec(
+                    select(Note).order_by(Note.id).execution_options(yield_per=500))
+                for index, note in enumerate(notes):
+                    f.write(("\n" if index == 0 else ",\n") + _dumps(note_record(note)))
+                f.write("\n]\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f.name, BACKUP_FILE)
+        except BaseException:
+            os.remove(f.name)
+            raise
+
+        if os.path.exists(rotated):
+            os.remove(rotated)
+        self._last_snapshot = time.monotonic()
+
+
+backup_writer = BackupWriter()
@@ -0,0 +1,147 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from sqlmodel import Session
+
+from .backup import backup_writer
+from .database import engine
+from .models import Note, NoteCreate
+from .revisions import record_first_revision
+from .search import index_new_notes
+from .tags import tag_new_note
+
+# Write batching configuration
+WRITE_BATCHING = os.getenv("NOTES_WRITE_BATCHING", "false").lower() in ("1", "true", "yes")
+# A batch is committed once it holds this many notes or its first note has
+# waited this long, whichever comes first
+WRITE_BATCH_SIZE = int(os.getenv("NOTES_WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_WAIT_MS = float(os.getenv("NOTES_WRITE_BATCH_WAIT_MS", "2"))
+
+logger = logging.getLogger("note_batching")
+
+
+def add_notes(session: Session, notes: List[NoteCreate]) -> List[Note]:
+    """Add new notes and everything derived from them, without committing
+
+    One flush assigns every id; search, tag and revision rows are then
+    written in bulk, skipping the lookups an existing note would need.
+    """
+    db_notes = [Note.from_orm(note) for note in notes]
+    session.add_all(db_notes)
+    session.flush()
+    index_new_notes(session, db_notes)
+    for note, db_note in zip(notes, db_notes):
+        tag_new_note(session, db_note, note.tags or [])
+        record_first_revision(session, db_note)
+    return db_notes
+
+
+def create_note_now(note: NoteCreate) -> Note:
+    """Create one note in its own transaction"""
+    with Session(engine, expire_on_commit=False) as session:
+        [db_note] = add_notes(session, [note])
+        session.commit()
+    backup_writer.record_upsert(db_note)
+    return db_note
+
+
+class NoteWriteBatcher:
+    """Group commit for note creation
+
+    Requests queue their note and wait on a future. A worker thread takes
+    whatever has queued up (up to WRITE_BATCH_SIZE, waiting at most
+    WRITE_BATCH_WAIT_MS after the first while writes are concurrent) and
+    creates it all in one transaction, so a burst of creates costs one
+    commit instead of one each. If a batch fails, its notes are retried
+    one at a time so only the bad one reports an error.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, wait_ms: float = WRITE_BATCH_WAIT_MS):
+        self.batch_size = batch_size
+        self.wait = wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[NoteCreate, Future]]" = queue.Queue()
+        self._stopping = threading.Event()
+        # Held while queueing and while stopping, so a note is never queued
+        # after the worker has been told to drain and exit
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_batch_size = 0
+
+    def submit(self, note: NoteCreate) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None or self._stopping.is_set():
+                future.set_exception(RuntimeError("Note write batcher is not running"))
+            else:
+                self._queue.put((note, future))
+        return future
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="notes-write-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping.set()
+        # Everything queued before this point is written before the worker exits
+        thread.join()
+        with self._lock:
+            self._thread = None
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Only hold the batch open while creates are actually arriving
+            # concurrently; a lone writer would just pay the wait
+            if len(batch) > 1 or self._last_batch_size > 1:
+                deadline = time.monotonic() + self.wait
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            self._last_batch_size = len(batch)
+            self._write(batch)
+
+    def _write(self, batch: List[Tuple[NoteCreate, Future]]):
+        try:
+            with Session(engine, expire_on_commit=False) as session:
+                notes = add_notes(session, [note for note, _ in batch])
+                session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            logger.warning(f"Note batch of {len(batch)} failed, retrying one by one: {e}")
+            for item in batch:
+                self._write([item])
+            return
+
+        for db_note, (_, future) in zip(notes, batch):
+            backup_writer.record_upsert(db_note)
+            future.set_result(db_note)
+
+
+note_batcher = NoteWriteBatcher()
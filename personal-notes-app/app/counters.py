@@ -0,0 +1,153 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: counts are then only safe within one process
+    fcntl = None
+
+# Shared counter configuration
+REQUEST_COUNTER_PATH = os.getenv("REQUEST_COUNTER_PATH", "request_counters.bin")
+REQUEST_COUNTER_SLOTS = int(os.getenv("REQUEST_COUNTER_SLOTS", "1024"))
+
+# File layout: a header, then a fixed-size open-addressing hash table of
+# (count, key) slots. Every worker maps the same file, so a count written
+# by one process is immediately visible to the others.
+MAGIC = b"NCOUNT01"
+HEADER = struct.Struct("<8sQd")  # magic, slot count, created (unix time)
+SLOT = struct.Struct("<Q120s")   # count, utf-8 key padded with NULs
+KEY_SIZE = 120
+# Counts for keys that find no free slot land here instead, and its home
+# slot is never handed to another key, so it always has room on a new file
+OVERFLOW_KEY = "route:other"
+
+# Methods get their own route counters; anything else a client sends is
+# counted as OTHER, so junk methods can't fill the table
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class SharedCounters:
+    """Named counters in an mmap'd file, shared by every worker process
+
+    Updates take an exclusive flock on the file (plus a thread lock, since
+    flock does not exclude threads sharing one descriptor), so increments
+    from concurrent workers and threads are never lost.
+    """
+
+    def __init__(self, path: str = REQUEST_COUNTER_PATH, slots: int = REQUEST_COUNTER_SLOTS):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        with self._locked(exclusive=True):
+            size = os.fstat(self._fd).st_size
+            if size < HEADER.size:
+                size = HEADER.size + slots * SLOT.size
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots, time.time()), 0)
+            magic, self.slots, self.created = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a request counter file")
+            self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _home(self, encoded: bytes) -> int:
+        # crc32 rather than hash(): it must agree across processes
+        return zlib.crc32(encoded) % self.slots
+
+    def _slot(self, key: str) -> Optional[int]:
+        """Offset of the slot for key, claiming an empty one if needed
+
+        None if the table is full; this runs on every request, so it
+        never raises for that.
+        """
+        encoded = key.encode()[:KEY_SIZE]
+        reserved = self._home(OVERFLOW_KEY.encode())
+        index = self._home(encoded)
+        for _ in range(self.slots):
+            offset = HEADER.size + index * SLOT.size
+            _, stored = SLOT.unpack_from(self._map, offset)
+            stored = stored.rstrip(b"\0")
+            if stored == encoded:
+                return offset
+            if not stored and (index != reserved or key == OVERFLOW_KEY):
+                SLOT.pack_into(self._map, offset, 0, encoded)
+                return offset
+            index = (index + 1) % self.slots
+        return None
+
+    def increment(self, *keys: str) -> int:
+        """Add one to each key in a single locked step; returns the first key's count
+
+        A key the full table has no room for is counted under OVERFLOW_KEY.
+        """
+        with self._locked(exclusive=True):
+            values = []
+            for key in keys:
+                offset = self._slot(key)
+                if offset is None:
+                    offset = self._slot(OVERFLOW_KEY)
+                if offset is None:
+                    values.append(0)
+                    continue
+                count, stored = SLOT.unpack_from(self._map, offset)
+                SLOT.pack_into(self._map, offset, count + 1, stored)
+                values.append(count + 1)
+        return values[0]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._locked(exclusive=False):
+            data = self._map[HEADER.size:HEADER.size + self.slots * SLOT.size]
+        counts = {}
+        for count, key in SLOT.iter_unpack(data):
+            key = key.rstrip(b"\0")
+            if key:
+                counts[key.decode(errors="replace")] = count
+        return counts
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def split_counts(counts: Dict[str, int], prefix: str) -> Dict[str, int]:
+    return {
+        key[len(prefix):]: value
+        for key, value in sorted(counts.items())
+        if key.startswith(prefix)
+    }
+
+
+def request_keys(method: str, route: str, status_code: int) -> Tuple[str, str, str]:
+    if method not in KNOWN_METHODS:
+        method = "OTHER"
+    return ("total", f"route:{method} {route}", f"status:{status_code}")
+
+
+_request_counters = None
+_request_counters_lock = threading.Lock()
+
+
+def get_request_counters() -> SharedCounters:
+    # Opened lazily so each worker maps the file after it has forked
+    global _request_counters
+    with _request_counters_lock:
+        if _request_counters is None:
+            _request_counters = SharedCounters()
+    return _request_counters
@@ -1,15 +1,53 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import inspect, text
+from sqlalchemy.orm.attributes import flag_modified
+from sqlmodel import SQLModel, Session, select
 import os
 
+from .engine import build_engine
+from .models import Note
+from .search import install_search_index
+from .tags import backfill_tags
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./notes.db")
 
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = build_engine(DATABASE_URL)
 
 
 def create_db_and_tables():
+    new_tag_table = not inspect(engine).has_table("notetag")
     SQLModel.metadata.create_all(engine)
+    migrate_note_preview()
+    install_search_index(engine)
+    if new_tag_table:
+        backfill_tags(engine)
+
+
+def migrate_note_preview(batch_size: int = 500) -> int:
+    """Add the preview column to older databases and fill it in"""
+    columns = {column["name"] for column in inspect(engine).get_columns("note")}
+    if "preview" in columns:
+        return 0
+    with engine.begin() as connection:
+        connection.execute(text(
+            "ALTER TABLE note ADD COLUMN preview VARCHAR NOT NULL DEFAULT ''"))
+
+    # Saving each note runs the preview hook on the model
+    updated, last_id = 0, 0
+    with Session(engine) as session:
+        while True:
+            notes = session.exec(
+                select(Note).where(Note.id > last_id).order_by(Note.id).limit(batch_size)
+            ).all()
+            if not notes:
+                return updated
+            for note in notes:
+                flag_modified(note, "content")
+            session.commit()
+            updated += len(notes)
+            last_id = notes[-1].id
+            session.expunge_all()
 
 
 def get_session():
@@ -1,13 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional, Union
+import asyncio
 import json
 import os
+from datetime import datetime
 
-from .models import Note, NoteCreate, NoteUpdate
+from .models import (
+    Note, NoteCreate, NoteUpdate, NoteSummary, NoteSearchPage, NoteSearchResult, RequestStats,
+    NoteRevisionInfo, NoteVersion, TagCount, NoteAttachment,
+)
 from .database import create_db_and_tables, get_session
 from .middleware import RequestCounterMiddleware
+from .counters import get_request_counters, split_counts
+from .backup import backup_writer, BACKUP_FILE, JOURNAL_FILE
+from .restore import restore_notes
+from .search import (
+    decode_cursor, encode_cursor, index_note, remove_note, search_notes as run_search, search_note_ids,
+)
+from .tags import delete_note_tags, note_tags, set_note_tags, tag_counts, tagged_note_ids
+from .batching import WRITE_BATCHING, create_note_now, note_batcher
+from .attachments import (
+    ATTACHMENT_MAX_BYTES, AttachmentTooLarge, add_attachment, attachment_response,
+    delete_note_attachments, note_exists, receive_blob, release_blobs, upload_media_type,
+)
+from .revisions import (
+    delete_revisions, ensure_base_revision, get_revision, list_revisions, lock_note, record_revision,
+)
 
 # Create FastAPI app
 app = FastAPI(title="Personal Notes App", version="1.0.0")
@@ -30,54 +52,71 @@ app.add_middleware(RequestCounterMiddleware)
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    backup_writer.start()
+    if WRITE_BATCHING:
+        note_batcher.start()
 
 
-def backup_notes_to_file(session: Session):
-    try:
-        notes = session.exec(select(Note)).all()
-        notes_data = []
-        for note in notes:
-            notes_data.append({
-                "id": note.id,
-                "title": note.title,
-                "content": note.content,
-                "created_at": note.created_at.isoformat()
-            })
-
-        with open("notes.json", "w") as f:
-            json.dump(notes_data, f, indent=2)
-    except Exception as e:
-        print(f"Error backing up notes: {e}")
+@app.on_event("shutdown")
+def on_shutdown():
+    # Commits queued notes first, so the final backup snapshot has them
+    note_batcher.stop()
+    # Flushes queued changes and writes a final snapshot
+    backup_writer.stop()
+
 
 # Notes endpoints
 
 
 @app.post("/notes/", response_model=Note)
-def create_note(
-    note: NoteCreate,
-    session: Session = Depends(get_session)
-):
-    db_note = Note.from_orm(note)
-    session.add(db_note)
-    session.commit()
-    session.refresh(db_note)
+async def create_note(note: NoteCreate):
+    # Both paths also queue the new note for the background backup
+    if WRITE_BATCHING:
+        return await asyncio.wrap_future(note_batcher.submit(note))
+    return await run_in_threadpool(create_note_now, note)
 
-    # Backup notes after creating
-    backup_notes_to_file(session)
 
-    return db_note
-
-
-@app.get("/notes/", response_model=List[Note])
+@app.get("/notes/", response_model=Union[List[Note], List[NoteSummary]])
 def get_notes(
     skip: int = 0,
     limit: int = 100,
+    summary: bool = Query(
+        False, description="Return id, title, created_at and a short preview instead of full content"),
     session: Session = Depends(get_session)
 ):
+    if summary:
+        # Only the small columns; content is never read from the table
+        rows = session.execute(
+            select(Note.id, Note.title, Note.created_at, Note.preview)
+            .order_by(Note.id).offset(skip).limit(limit)
+        ).mappings()
+        return [NoteSummary(**row) for row in rows]
+
     notes = session.exec(select(Note).offset(skip).limit(limit)).all()
     return notes
 
 
+@app.get("/notes/search", response_model=NoteSearchPage)
+def search_notes_ranked(
+    q: str = Query(..., min_length=1,
+                   description="Terms that must all match; end a term with * for a prefix match"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor from the previous page"),
+    session: Session = Depends(get_session)
+):
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    rows = run_search(session, q, limit, after)
+    return NoteSearchPage(
+        results=[NoteSearchResult(**row) for row in rows],
+        next_cursor=encode_cursor(rows[-1]) if len(rows) == limit else None,
+    )
+
+
 @app.get("/notes/{note_id}", response_model=Note)
 def get_note(
     note_id: int,
@@ -95,20 +134,27 @@ def update_note(
     note: NoteUpdate,
     session: Session = Depends(get_session)
 ):
+    lock_note(session, note_id)
     db_note = session.get(Note, note_id)
     if not db_note:
         raise HTTPException(status_code=404, detail="Note not found")
 
+    ensure_base_revision(session, db_note)
+
     note_data = note.dict(exclude_unset=True)
+    tags = note_data.pop("tags", None)
     for key, value in note_data.items():
         setattr(db_note, key, value)
 
     session.add(db_note)
+    index_note(session, db_note)
+    set_note_tags(session, db_note, tags)
+    record_revision(session, db_note)
     session.commit()
     session.refresh(db_note)
 
-    # Backup notes after updating
-    backup_notes_to_file(session)
+    # Queue the change for the background backup
+    backup_writer.record_upsert(db_note)
 
     return db_note
 
@@ -122,11 +168,16 @@ def delete_note(
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
 
+    delete_revisions(session, note_id)
+    delete_note_tags(session, note_id)
+    attachment_hashes = delete_note_attachments(session, note_id)
     session.delete(note)
+    remove_note(session, note_id)
     session.commit()
+    release_blobs(attachment_hashes)
 
-    # Backup notes after deleting
-    backup_notes_to_file(session)
+    # Queue the change for the background backup
+    backup_writer.record_delete(note_id)
 
     return {"message": "Note deleted successfully"}
 
@@ -134,39 +185,186 @@ def delete_note(
 @app.get("/notes/search/{query}", response_model=List[Note])
 def search_notes(
     query: str,
+    limit: int = Query(100, ge=1, le=500),
     session: Session = Depends(get_session)
 ):
-    notes = session.exec(
-        select(Note).where(
-            (Note.title.contains(query)) | (Note.content.contains(query))
-        )
+    # Best matches first, from the full-text index
+    note_ids = search_note_ids(session, query, limit)
+    notes = {
+        note.id: note
+        for note in session.exec(select(Note).where(Note.id.in_(note_ids)))
+    } if note_ids else {}
+    return [notes[note_id] for note_id in note_ids if note_id in notes]
+
+
+# Attachment endpoints
+
+@app.post("/notes/{note_id}/attachments", response_model=NoteAttachment, status_code=201)
+async def upload_attachment(
+    note_id: int,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+):
+    """Upload the raw request body as an attachment
+
+    Send the file itself as the body (not multipart form data); its
+    Content-Type is kept as the attachment's media type.
+    """
+    if not await run_in_threadpool(note_exists, note_id):
+        raise HTTPException(status_code=404, detail="Note not found")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Attachment too large")
+
+    media_type = upload_media_type(request.headers.get("content-type"), filename)
+
+    try:
+        sha256, size, temp_path = await receive_blob(request.stream())
+    except AttachmentTooLarge:
+        raise HTTPException(status_code=413, detail="Attachment too large")
+
+    attachment = await run_in_threadpool(
+        add_attachment, note_id, filename, media_type, sha256, size, temp_path)
+    if attachment is None:
+        # The note was deleted while the upload was running
+        raise HTTPException(status_code=404, detail="Note not found")
+    return attachment
+
+
+@app.get("/notes/{note_id}/attachments", response_model=List[NoteAttachment])
+def get_attachments(
+    note_id: int,
+    session: Session = Depends(get_session)
+):
+    if not session.get(Note, note_id):
+        raise HTTPException(status_code=404, detail="Note not found")
+    return session.exec(
+        select(NoteAttachment).where(NoteAttachment.note_id == note_id).order_by(NoteAttachment.id)
     ).all()
-    return notes
+
+
+@app.api_route("/notes/{note_id}/attachments/{attachment_id}", methods=["GET", "HEAD"])
+def download_attachment(
+    note_id: int,
+    attachment_id: int,
+    request: Request,
+    session: Session = Depends(get_session)
+):
+    attachment = session.get(NoteAttachment, attachment_id)
+    if not attachment or attachment.note_id != note_id:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return attachment_response(request, attachment)
+
+
+@app.delete("/notes/{note_id}/attachments/{attachment_id}")
+def delete_attachment(
+    note_id: int,
+    attachment_id: int,
+    session: Session = Depends(get_session)
+):
+    attachment = session.get(NoteAttachment, attachment_id)
+    if not attachment or attachment.note_id != note_id:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    session.delete(attachment)
+    session.commit()
+    release_blobs([attachment.sha256])
+
+    return {"message": "Attachment deleted successfully"}
+
+
+# Tag endpoints
+
+
+@app.get("/tags/", response_model=List[TagCount])
+def get_tags(
+    prefix: Optional[str] = Query(None, description="Only tags starting with this"),
+    session: Session = Depends(get_session)
+):
+    return tag_counts(session, prefix.lstrip("#").lower() if prefix else None)
+
+
+@app.get("/tags/notes", response_model=List[Note])
+def get_tagged_notes(
+    tags: List[str] = Query(..., description="Repeat or comma-separate: ?tags=work,urgent"),
+    match: str = Query("all", regex="^(all|any)$"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    session: Session = Depends(get_session)
+):
+    wanted = [tag.strip().lstrip("#").lower() for value in tags for tag in value.split(",")]
+    wanted = [tag for tag in wanted if tag]
+    if not wanted:
+        raise HTTPException(status_code=400, detail="At least one tag is required")
+    return session.exec(
+        select(Note)
+        .where(Note.id.in_(tagged_note_ids(wanted, match)))
+        .order_by(Note.id).offset(skip).limit(limit)
+    ).all()
+
+
+@app.get("/notes/{note_id}/tags", response_model=List[str])
+def get_note_tags(
+    note_id: int,
+    session: Session = Depends(get_session)
+):
+    if not session.get(Note, note_id):
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note_tags(session, note_id)
+
+
+# Revision endpoints
+
+
+@app.get("/notes/{note_id}/revisions", response_model=List[NoteRevisionInfo])
+def get_note_revisions(
+    note_id: int,
+    session: Session = Depends(get_session)
+):
+    if not session.get(Note, note_id):
+        raise HTTPException(status_code=404, detail="Note not found")
+    return list_revisions(session, note_id)
+
+
+@app.get("/notes/{note_id}/revisions/{revision}", response_model=NoteVersion)
+def get_note_revision(
+    note_id: int,
+    revision: int,
+    session: Session = Depends(get_session)
+):
+    version = get_revision(session, note_id, revision)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return version
+
+
+def _restore_progress_lines():
+    try:
+        for progress in restore_notes():
+            yield json.dumps(progress) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": f"Error restoring from backup: {str(e)}"}) + "\n"
+
+
+@app.post("/backup/restore")
+def restore_from_backup_streaming():
+    if not os.path.exists(BACKUP_FILE) and not os.path.exists(JOURNAL_FILE):
+        raise HTTPException(status_code=404, detail="Backup file not found")
+
+    # One NDJSON progress line per restored batch, then a final "done" line
+    return StreamingResponse(
+        _restore_progress_lines(), media_type="application/x-ndjson")
 
 
 @app.get("/backup/restore")
-def restore_from_backup(session: Session = Depends(get_session)):
-    if not os.path.exists("notes.json"):
+def restore_from_backup():
+    if not os.path.exists(BACKUP_FILE) and not os.path.exists(JOURNAL_FILE):
         raise HTTPException(status_code=404, detail="Backup file not found")
 
     try:
-        with open("notes.json", "r") as f:
-            notes_data = json.load(f)
-
-        restored_count = 0
-        for note_data in notes_data:
-            # Check if note already exists
-            existing_note = session.get(Note, note_data.get("id"))
-            if not existing_note:
-                db_note = Note(
-                    title=note_data["title"],
-                    content=note_data["content"]
-                )
-                session.add(db_note)
-                restored_count += 1
-
-        session.commit()
-        return {"message": f"Restored {restored_count} notes from backup"}
+        for progress in restore_notes():
+            pass
+        return {"message": f"Restored {progress['restored']} notes from backup"}
 
     except Exception as e:
         raise HTTPException(
@@ -174,6 +372,20 @@ def restore_from_backup(session: Session = Depends(get_session)):
             detail=f"Error restoring from backup: {str(e)}"
         )
 
+# Stats endpoints
+
+
+@app.get("/stats/requests", response_model=RequestStats)
+def request_stats():
+    counters = get_request_counters()
+    counts = counters.snapshot()
+    return RequestStats(
+        since=datetime.fromtimestamp(counters.created),
+        total=counts.get("total", 0),
+        by_route=split_counts(counts, "route:"),
+        by_status=split_counts(counts, "status:"),
+    )
+
 # Health check endpoint
 
 
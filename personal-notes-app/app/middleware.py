@@ -3,6 +3,8 @@ from starlette.middleware.base import BaseHTTPMiddleware
 import logging
 from datetime import datetime
 
+from .counters import get_request_counters, request_keys
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -11,23 +13,28 @@ logging.basicConfig(
 
 
 class RequestCounterMiddleware(BaseHTTPMiddleware):
+    # Counts live in a file shared by all workers (see counters.py), so the
+    # numbers are totals for the whole server, not for one process
     def __init__(self, app):
         super().__init__(app)
-        self.request_count = 0
         self.logger = logging.getLogger("request_counter")
 
     async def dispatch(self, request: Request, call_next):
-        self.request_count += 1
-
         # Get client IP
         client_ip = request.client.host if request.client else "unknown"
 
         # Process request
         response = await call_next(request)
 
+        # Count by route template so /notes/1 and /notes/2 share one counter
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "unmatched"
+        request_count = get_request_counters().increment(
+            *request_keys(request.method, route_path, response.status_code))
+
         # Log request details with count
         log_message = (
-            f"Request #{self.request_count} | "
+            f"Request #{request_count} | "
             f"Method: {request.method} | "
             f"URL: {request.url} | "
             f"IP: {client_ip} | "
@@ -38,6 +45,6 @@ class RequestCounterMiddleware(BaseHTTPMiddleware):
         self.logger.info(log_message)
 
         # Add request count to response headers
-        response.headers["X-Request-Count"] = str(self.request_count)
+        response.headers["X-Request-Count"] = str(request_count)
 
         return response
@@ -1,7 +1,11 @@
-from sqlmodel import SQLModel, Field
-from typing import Optional
+from sqlmodel import SQLModel, Field, Column
+from pydantic import validator
+from sqlalchemy import Index, event
+from typing import Optional, List, Dict
 from datetime import datetime
 
+from .storage import CompressedText, make_preview
+
 # Note Models
 
 
@@ -12,13 +16,134 @@ class NoteBase(SQLModel):
 
 class Note(NoteBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    content: str = Field(sa_column=Column(CompressedText, nullable=False))
     created_at: datetime = Field(default_factory=datetime.now)
+    # Kept in step with content so list views never have to load it
+    preview: str = Field(default="")
+
+
+@event.listens_for(Note, "before_insert")
+@event.listens_for(Note, "before_update")
+def _set_note_preview(mapper, connection, note):
+    note.preview = make_preview(note.content)
+
+
+def _normalize_tags(tags):
+    from .tags import normalize_tag
+
+    if tags is None:
+        return tags
+    return sorted({normalize_tag(tag) for tag in tags})
 
 
 class NoteCreate(NoteBase):
-    pass
+    # Hashtags in content are picked up as tags as well
+    tags: Optional[List[str]] = None
+
+    _tags = validator("tags", allow_reuse=True)(_normalize_tags)
 
 
 class NoteUpdate(SQLModel):
     title: Optional[str] = None
     content: Optional[str] = None
+    # Replaces the note's explicit tags; hashtags in content always count
+    tags: Optional[List[str]] = None
+
+    _tags = validator("tags", allow_reuse=True)(_normalize_tags)
+
+
+# Tag Models
+
+
+class NoteTag(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_notetag_tag_note", "tag", "note_id"),
+    )
+
+    note_id: int = Field(foreign_key="note.id", primary_key=True)
+    tag: str = Field(primary_key=True)
+    # False when the tag only comes from a #hashtag in the content
+    explicit: bool = False
+
+
+class TagCount(SQLModel):
+    tag: str
+    count: int
+
+
+# Attachment Models
+
+
+class NoteAttachment(SQLModel, table=True):
+    # File bytes live on disk under their sha256 (see attachments.py); rows
+    # that share a hash share one file
+    id: Optional[int] = Field(default=None, primary_key=True)
+    note_id: int = Field(foreign_key="note.id", index=True)
+    filename: str
+    media_type: str
+    size: int
+    sha256: str = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+# Revision Models
+
+
+class NoteRevision(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_noterevision_note_revision", "note_id", "revision", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    note_id: int = Field(foreign_key="note.id")
+    revision: int
+    title: str
+    # Snapshots hold the full content; other revisions hold a line diff
+    # (JSON) against the revision before them
+    is_snapshot: bool = False
+    data: str = Field(sa_column=Column(CompressedText, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class NoteRevisionInfo(SQLModel):
+    revision: int
+    title: str
+    is_snapshot: bool
+    created_at: datetime
+
+
+class NoteVersion(SQLModel):
+    note_id: int
+    revision: int
+    title: str
+    content: str
+    created_at: datetime
+
+
+class NoteSummary(SQLModel):
+    id: int
+    title: str
+    created_at: datetime
+    preview: str
+
+
+class NoteSearchResult(SQLModel):
+    id: int
+    # Title and snippet carry <mark> highlights around matched terms
+    title: str
+    snippet: str
+    rank: float
+    created_at: datetime
+
+
+class NoteSearchPage(SQLModel):
+    results: List[NoteSearchResult]
+    next_cursor: Optional[str] = None
+
+
+class RequestStats(SQLModel):
+    # Totals across every worker since the counter file was created
+    since: datetime
+    total: int
+    by_route: Dict[str, int]
+    by_status: Dict[str, int]
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from .backup import BACKUP_FILE, JOURNAL_FILE
+from .database import engine
+from .models import Note
+from .search import index_new_notes
+from .tags import tag_new_note
+
+# Restore configuration
+RESTORE_BATCH_SIZE = int(os.getenv("NOTES_RESTORE_BATCH_SIZE", "500"))
+RESTORE_READ_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_array(f: TextIO, read_size: int = RESTORE_READ_SIZE) -> Iterator:
+    """Yield the items of a JSON array file one at a time
+
+    Only the current item (plus one read) is held in memory, so the file
+    can be far larger than RAM.
+    """
+    decoder = json.JSONDecoder()
+    # Items are decoded in place from pos; the buffer is only cut down when
+    # the next read is appended, not once per item
+    buffer, pos = "", 0
+    eof = False
+    started = False
+    want = read_size
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer):
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError("Backup file is not a JSON array")
+                pos, started = pos + 1, True
+                continue
+            if char == ",":
+                pos += 1
+                continue
+            if char == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                # Item is cut off; read at least as much again as we hold
+                want = max(read_size, len(buffer) - pos)
+            else:
+                yield item
+                pos = end
+                want = read_size
+                continue
+        elif eof:
+            if started:
+                raise ValueError("Unexpected end of backup file")
+            return
+
+        chunk = f.read(want)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def journal_state() -> Dict[int, Optional[dict]]:
+    """Latest journaled version of each note; None means deleted"""
+    state: Dict[int, Optional[dict]] = {}
+    for path in (f"{JOURNAL_FILE}.old", JOURNAL_FILE):
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-append
+                    continue
+                if entry.get("op") == "upsert":
+                    state[entry["note"]["id"]] = entry["note"]
+                elif entry.get("op") == "delete":
+                    state[entry["id"]] = None
+    return state
+
+
+def _note_from_record(record: dict) -> Note:
+    note = Note(title=record["title"], content=record["content"])
+    if record.get("id") is not None:
+        note.id = record["id"]
+    if record.get("created_at"):
+        note.created_at = datetime.fromisoformat(record["created_at"])
+    return note
+
+
+def restore_batch(session: Session, records: List[dict]) -> int:
+    """Insert the notes that are not in the database yet, in one transaction"""
+    ids = [record["id"] for record in records if record.get("id") is not None]
+    existing = set()
+    if ids:
+        existing = set(session.exec(select(Note.id).where(Note.id.in_(ids))).all())
+
+    notes = [
+        _note_from_record(record)
+        for record in records
+        if record.get("id") is None or record["id"] not in existing
+    ]
+    session.add_all(notes)
+    session.flush()
+    # Every note here was just inserted, so there are no old search or tag
+    # rows to look up first
+    index_new_notes(session, notes)
+    for note in notes:
+        tag_new_note(session, note, [])
+    session.commit()
+    return len(notes)
+
+
+def _sync_id_sequence(session: Session):
+    # Restored rows carry explicit ids; move the sequence past them
+    if session.get_bind().dialect.name == "postgresql":
+        session.exec(text(
+            "SELECT setval(pg_get_serial_sequence('note', 'id'), "
+            "COALESCE((SELECT MAX(id) FROM note), 1))"
+        ))
+        session.commit()
+
+
+def restore_notes() -> Iterator[dict]:
+    """Restore the snapshot plus journal, yielding progress after each batch"""
+    overrides = journal_state()
+    overridden = set()
+    progress = {"processed": 0, "restored": 0}
+    batch: List[dict] = []
+
+    def flush():
+        progress["processed"] += len(batch)
+        progress["restored"] += restore_batch(session, batch)
+        batch.clear()
+        return dict(progress)
+
+    with Session(engine) as session:
+        if os.path.exists(BACKUP_FILE):
+            with open(BACKUP_FILE) as f:
+                for record in iter_json_array(f):
+                    note_id = record.get("id")
+                    if note_id in overrides:
+                        overridden.add(note_id)
+                        record = overrides[note_id]
+                        if record is None:
+                            continue
+                    batch.append(record)
+                    if len(batch) >= RESTORE_BATCH_SIZE:
+                        yield flush()
+
+        # Notes created after the last snapshot exist only in the journal
+        for note_id, record in overrides.items():
+            if record is not None and note_id not in overridden:
+                batch.append(record)
+                if len(batch) >= RESTORE_BATCH_SIZE:
+                    yield flush()
+
+        if batch:
+            yield flush()
+        _sync_id_sequence(session)
+
+    yield {**progress, "done": True}
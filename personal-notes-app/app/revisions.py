@@ -0,0 +1,151 @@
+import json
+import os
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+
+from .models import Note, NoteRevision
+
+# Revision configuration
+# Every Kth revision stores the full content, so rebuilding any revision
+# applies at most K - 1 diffs
+REVISION_SNAPSHOT_EVERY = int(os.getenv("NOTE_REVISION_SNAPSHOT_EVERY", "10"))
+
+
+def diff_lines(old: str, new: str) -> list:
+    """Line diff from old to new
+
+    ["=", i, j] copies old lines i..j, ["+", [lines]] adds new lines;
+    deleted lines are simply not copied.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["+", new_lines[j1:j2]])
+    return ops
+
+
+def apply_diff(old: str, ops: list) -> str:
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "=":
+            parts.extend(old_lines[op[1]:op[2]])
+        else:
+            parts.extend(op[1])
+    return "".join(parts)
+
+
+def _chain(session: Session, note_id: int, revision: Optional[int] = None) -> List[NoteRevision]:
+    """The nearest snapshot at or before revision, then every diff up to it"""
+    snapshot_query = select(func.max(NoteRevision.revision)).where(
+        NoteRevision.note_id == note_id, NoteRevision.is_snapshot == True  # noqa: E712
+    )
+    if revision is not None:
+        snapshot_query = snapshot_query.where(NoteRevision.revision <= revision)
+    snapshot = session.exec(snapshot_query).one()
+    if snapshot is None:
+        return []
+
+    query = select(NoteRevision).where(
+        NoteRevision.note_id == note_id, NoteRevision.revision >= snapshot)
+    if revision is not None:
+        query = query.where(NoteRevision.revision <= revision)
+    return session.exec(query.order_by(NoteRevision.revision)).all()
+
+
+def _content(chain: List[NoteRevision]) -> str:
+    content = chain[0].data
+    for revision in chain[1:]:
+        content = apply_diff(content, json.loads(revision.data))
+    return content
+
+
+def record_first_revision(session: Session, note: Note):
+    """record_revision for a note that was just inserted"""
+    session.add(NoteRevision(
+        note_id=note.id, revision=1, title=note.title,
+        is_snapshot=True, data=note.content))
+
+
+def lock_note(session: Session, note_id: int):
+    """Hold the note's row until the transaction ends
+
+    Call before reading the note, so a concurrent update of the same note
+    waits instead of picking the same next revision number. A no-op write
+    is the lock that works on both databases: a row lock on PostgreSQL, the
+    write lock on SQLite.
+    """
+    session.exec(
+        update(Note).where(Note.id == note_id).values(title=Note.title)
+        .execution_options(synchronize_session=False))
+
+
+def ensure_base_revision(session: Session, note: Note):
+    """Give a note from before revisions existed its current state as revision 1
+
+    Call before changing the note, so the state being replaced is kept.
+    """
+    exists = session.exec(
+        select(NoteRevision.id).where(NoteRevision.note_id == note.id).limit(1)
+    ).first()
+    if exists is None:
+        record_revision(session, note)
+
+
+def record_revision(session: Session, note: Note):
+    """Add the note's current title and content as its next revision
+
+    Call after every change. Does nothing if neither title nor content
+    differ from the latest revision.
+    """
+    chain = _chain(session, note.id)
+    if not chain:
+        record_first_revision(session, note)
+        return
+
+    latest = chain[-1]
+    previous = _content(chain)
+    if latest.title == note.title and previous == note.content:
+        return
+
+    if len(chain) >= REVISION_SNAPSHOT_EVERY:
+        is_snapshot, data = True, note.content
+    else:
+        is_snapshot = False
+        data = json.dumps(diff_lines(previous, note.content), separators=(",", ":"))
+    session.add(NoteRevision(
+        note_id=note.id, revision=latest.revision + 1, title=note.title,
+        is_snapshot=is_snapshot, data=data))
+
+
+def list_revisions(session: Session, note_id: int) -> List[NoteRevision]:
+    return session.exec(
+        select(NoteRevision)
+        .where(NoteRevision.note_id == note_id)
+        .order_by(NoteRevision.revision.desc())
+    ).all()
+
+
+def get_revision(session: Session, note_id: int, revision: int) -> Optional[dict]:
+    chain = _chain(session, note_id, revision)
+    if not chain or chain[-1].revision != revision:
+        return None
+    return {
+        "note_id": note_id,
+        "revision": revision,
+        "title": chain[-1].title,
+        "content": _content(chain),
+        "created_at": chain[-1].created_at,
+    }
+
+
+def delete_revisions(session: Session, note_id: int):
+    session.exec(delete(NoteRevision).where(NoteRevision.note_id == note_id))
@@ -0,0 +1,210 @@
+import math
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from .models import Note
+
+# Notes are searched through a dedicated full-text table that holds its own
+# copy of title and content: FTS5 on SQLite (ranked with BM25) and a
+# tsvector column with a GIN index on PostgreSQL (ranked with ts_rank_cd).
+# The endpoints keep it in step with the note table in the same transaction.
+#
+# The copy is plain text even when note content is stored compressed, so
+# search roughly doubles the space a large note takes. FTS5 could read the
+# text from the note table instead (external content), but SQLite has no
+# SQL function to decompress it, and an external-content index must be
+# given a note's old title and content to remove it on update or delete.
+TS_CONFIG = "english"
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_TOKENS = 16
+# Title matches count for more than body matches
+TITLE_WEIGHT = 5.0
+
+_TERM_RE = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def install_search_index(engine: Engine):
+    """Create the search table; a newly created one is filled from the notes"""
+    with engine.begin() as connection:
+        if _dialect(engine) == "sqlite":
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_fts'"
+            )).first()
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS note_fts "
+                "USING fts5(title, content, tokenize='unicode61')"
+            ))
+        elif _dialect(engine) == "postgresql":
+            exists = connection.execute(text(
+                "SELECT to_regclass('note_search')"
+            )).scalar()
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS note_search ("
+                "note_id integer PRIMARY KEY REFERENCES note(id) ON DELETE CASCADE, "
+                "title text NOT NULL, content text NOT NULL, document tsvector NOT NULL)"
+            ))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_note_search_document "
+                "ON note_search USING gin (document)"
+            ))
+        else:
+            return
+
+    if not exists:
+        with Session(engine) as session:
+            notes = session.exec(
+                select(Note).order_by(Note.id).execution_options(yield_per=500))
+            for note in notes:
+                index_note(session, note)
+            session.commit()
+
+
+def index_note(session: Session, note: Note):
+    """(Re)index one note; call after flush so the note has its id"""
+    params = {"id": note.id, "title": note.title, "content": note.content}
+    if _dialect(session.get_bind()) == "sqlite":
+        session.exec(text("DELETE FROM note_fts WHERE rowid = :id"), params=params)
+        session.exec(text(
+            "INSERT INTO note_fts(rowid, title, content) VALUES (:id, :title, :content)"
+        ), params=params)
+    elif _dialect(session.get_bind()) == "postgresql":
+        session.exec(text(
+            "INSERT INTO note_search (note_id, title, content, document) "
+            "VALUES (:id, :title, :content, "
+            f"setweight(to_tsvector('{TS_CONFIG}', :title), 'A') || "
+            f"setweight(to_tsvector('{TS_CONFIG}', :content), 'B')) "
+            "ON CONFLICT (note_id) DO UPDATE SET title = excluded.title, "
+            "content = excluded.content, document = excluded.document"
+        ), params=params)
+
+
+def index_new_notes(session: Session, notes: List[Note]):
+    """Index notes that were just inserted, in one statement"""
+    if not notes:
+        return
+    params = [{"id": note.id, "title": note.title, "content": note.content} for note in notes]
+    if _dialect(session.get_bind()) == "sqlite":
+        session.execute(text(
+            "INSERT INTO note_fts(rowid, title, content) VALUES (:id, :title, :content)"
+        ), params)
+    else:
+        for note in notes:
+            index_note(session, note)
+
+
+def remove_note(session: Session, note_id: int):
+    if _dialect(session.get_bind()) == "sqlite":
+        session.exec(text("DELETE FROM note_fts WHERE rowid = :id"),
+                     params={"id": note_id})
+    elif _dialect(session.get_bind()) == "postgresql":
+        session.exec(text("DELETE FROM note_search WHERE note_id = :id"),
+                     params={"id": note_id})
+
+
+def parse_query(query: str) -> List[Tuple[str, bool]]:
+    """Split a query into (term, is_prefix) pairs; "meet*" is a prefix term"""
+    return [(term.lower(), bool(star)) for term, star in _TERM_RE.findall(query)]
+
+
+def encode_cursor(row: dict) -> str:
+    # repr() round-trips the float exactly, so the next page starts right
+    # after this row
+    return f"{float(row['rank'])!r}:{row['id']}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[float, int]]:
+    """The (rank, id) a next_cursor points after, or None if it isn't one"""
+    rank, _, note_id = cursor.partition(":")
+    try:
+        rank = float(rank)
+    except ValueError:
+        return None
+    if not math.isfinite(rank) or not note_id.isdigit():
+        return None
+    return rank, int(note_id)
+
+
+def search_notes(
+    session: Session, query: str, limit: int, after: Optional[Tuple[float, int]] = None,
+) -> List[dict]:
+    """Best matches first, as dicts with id, title, snippet, rank and created_at
+
+    Every term must match. Lower rank is better on SQLite (BM25) and higher
+    is better on PostgreSQL; results are already in order either way. Pages
+    continue after the (rank, id) of the previous page's last row, so a deep
+    page costs the same as the first.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return []
+
+    params = {"limit": limit, "start": HIGHLIGHT_START, "end": HIGHLIGHT_END}
+    if after is not None:
+        params["after_rank"], params["after_id"] = after
+
+    if _dialect(session.get_bind()) == "sqlite":
+        params["match"] = " ".join(
+            f'"{term}"' + ("*" if prefix else "") for term, prefix in terms)
+        rank = f"bm25(note_fts, {TITLE_WEIGHT}, 1.0)"
+        keyset = f"AND ({rank}, note.id) > (:after_rank, :after_id) " if after else ""
+        statement = text(
+            "SELECT note.id AS id, note.created_at AS created_at, "
+            "highlight(note_fts, 0, :start, :end) AS title, "
+            f"snippet(note_fts, 1, :start, :end, '…', {SNIPPET_TOKENS}) AS snippet, "
+            f"{rank} AS rank "
+            "FROM note_fts JOIN note ON note.id = note_fts.rowid "
+            f"WHERE note_fts MATCH :match {keyset}"
+            "ORDER BY rank, note.id LIMIT :limit"
+        )
+    elif _dialect(session.get_bind()) == "postgresql":
+        params["tsquery"] = " & ".join(
+            term + (":*" if prefix else "") for term, prefix in terms)
+        options = (f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, "
+                   f"MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS // 2}")
+        # Descending rank, so the row comparison is spelled out; the cursor
+        # is cast back to real, the type ts_rank_cd returns
+        keyset = (
+            "AND (ts_rank_cd(s.document, q) < CAST(:after_rank AS real) "
+            "OR (ts_rank_cd(s.document, q) = CAST(:after_rank AS real) AND note.id > :after_id)) "
+            if after else ""
+        )
+        statement = text(
+            "SELECT note.id AS id, note.created_at AS created_at, "
+            f"ts_headline('{TS_CONFIG}', s.title, q, 'HighlightAll=true') AS title, "
+            f"ts_headline('{TS_CONFIG}', s.content, q, '{options}') AS snippet, "
+            "ts_rank_cd(s.document, q) AS rank "
+            f"FROM note_search s, to_tsquery('{TS_CONFIG}', :tsquery) q, note "
+            f"WHERE note.id = s.note_id AND s.document @@ q {keyset}"
+            "ORDER BY rank DESC, note.id LIMIT :limit"
+        )
+    else:
+        # Other databases get the old unranked substring scan
+        clauses = [
+            Note.title.contains(term) | Note.content.contains(term)
+            for term, _ in terms
+        ]
+        if after is not None:
+            clauses.append(Note.id > after[1])
+        notes = session.exec(
+            select(Note).where(*clauses).order_by(Note.id).limit(limit)
+        ).all()
+        return [
+            {"id": note.id, "created_at": note.created_at, "title": note.title,
+             "snippet": note.content[:200], "rank": 0.0}
+            for note in notes
+        ]
+
+    return [dict(row) for row in session.execute(statement, params).mappings()]
+
+
+def search_note_ids(session: Session, query: str, limit: int) -> List[int]:
+    return [row["id"] for row in search_notes(session, query, limit)]
@@ -0,0 +1,65 @@
+import base64
+import os
+import re
+import zlib
+
+from sqlalchemy.types import TypeDecorator
+from sqlmodel.sql.sqltypes import AutoString
+
+# Storage configuration
+# Content of at least this many bytes is stored zlib-compressed; 0 disables it
+COMPRESS_MIN_BYTES = int(os.getenv("NOTES_COMPRESS_MIN_BYTES", "0"))
+COMPRESS_LEVEL = int(os.getenv("NOTES_COMPRESS_LEVEL", "6"))
+PREVIEW_LENGTH = int(os.getenv("NOTES_PREVIEW_LENGTH", "200"))
+
+# Compressed values are stored as text so the column type never changes
+COMPRESSED_MARKER = "\x01zlib:"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def compress_text(value: str) -> str:
+    packed = base64.b64encode(zlib.compress(value.encode(), COMPRESS_LEVEL))
+    return COMPRESSED_MARKER + packed.decode("ascii")
+
+
+def decompress_text(value: str) -> str:
+    packed = value[len(COMPRESSED_MARKER):].encode("ascii")
+    return zlib.decompress(base64.b64decode(packed)).decode()
+
+
+class CompressedText(TypeDecorator):
+    """Text column that transparently compresses large values
+
+    Reads always decode compressed values, so the threshold can be changed
+    (or compression switched off) at any time; rows are rewritten in the
+    new form the next time they are saved.
+    """
+
+    impl = AutoString
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        # Text that happens to start with the marker must be encoded, or it
+        # would be mistaken for compressed data when read back
+        if value.startswith(COMPRESSED_MARKER):
+            return compress_text(value)
+        if COMPRESS_MIN_BYTES and len(value.encode()) >= COMPRESS_MIN_BYTES:
+            compressed = compress_text(value)
+            if len(compressed) < len(value.encode()):
+                return compressed
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.startswith(COMPRESSED_MARKER):
+            return decompress_text(value)
+        return value
+
+
+def make_preview(content: str) -> str:
+    preview = _WHITESPACE_RE.sub(" ", content).strip()
+    if len(preview) > PREVIEW_LENGTH:
+        preview = preview[:PREVIEW_LENGTH - 1].rstrip() + "…"
+    return preview
@@ -0,0 +1,112 @@
+import re
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import delete, func
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from .models import Note, NoteTag, TagCount
+
+MAX_TAG_LENGTH = 64
+
+# "#work" and "#q3-plans", but not "C#", "&#39;" or "issue#12"
+HASHTAG_RE = re.compile(r"(?<![\w#&])#(\w[\w-]*)", re.UNICODE)
+TAG_RE = re.compile(r"^\w[\w-]*$", re.UNICODE)
+
+
+def normalize_tag(tag: str) -> str:
+    tag = tag.strip().lstrip("#").rstrip("-").lower()
+    if not TAG_RE.match(tag) or len(tag) > MAX_TAG_LENGTH:
+        raise ValueError(f"Invalid tag: {tag!r}")
+    return tag
+
+
+def extract_tags(content: str) -> Set[str]:
+    tags = set()
+    for match in HASHTAG_RE.finditer(content):
+        tag = match.group(1).rstrip("-").lower()
+        if tag and len(tag) <= MAX_TAG_LENGTH:
+            tags.add(tag)
+    return tags
+
+
+def note_tags(session: Session, note_id: int) -> List[str]:
+    return session.exec(
+        select(NoteTag.tag).where(NoteTag.note_id == note_id).order_by(NoteTag.tag)
+    ).all()
+
+
+def set_note_tags(session: Session, note: Note, explicit: Optional[Iterable[str]] = None):
+    """Store the note's explicit tags plus the hashtags in its content
+
+    explicit=None keeps the explicit tags the note already has.
+    """
+    current = session.exec(select(NoteTag).where(NoteTag.note_id == note.id)).all()
+    if explicit is None:
+        explicit = {row.tag for row in current if row.explicit}
+    else:
+        explicit = set(explicit)
+    wanted = {tag: tag in explicit for tag in explicit | extract_tags(note.content)}
+
+    for row in current:
+        if row.tag not in wanted:
+            session.delete(row)
+        elif row.explicit != wanted[row.tag]:
+            row.explicit = wanted[row.tag]
+            session.add(row)
+    existing = {row.tag for row in current}
+    session.add_all([
+        NoteTag(note_id=note.id, tag=tag, explicit=is_explicit)
+        for tag, is_explicit in wanted.items()
+        if tag not in existing
+    ])
+
+
+def tag_new_note(session: Session, note: Note, explicit: Iterable[str]):
+    """set_note_tags for a note that was just inserted and has no tags yet"""
+    explicit = set(explicit)
+    session.add_all([
+        NoteTag(note_id=note.id, tag=tag, explicit=tag in explicit)
+        for tag in explicit | extract_tags(note.content)
+    ])
+
+
+def delete_note_tags(session: Session, note_id: int):
+    session.exec(delete(NoteTag).where(NoteTag.note_id == note_id))
+
+
+def tag_counts(session: Session, prefix: Optional[str] = None) -> List[TagCount]:
+    query = select(NoteTag.tag, func.count(NoteTag.note_id).label("count"))
+    if prefix:
+        # A range on the (tag, note_id) index rather than a LIKE scan
+        query = query.where(NoteTag.tag >= prefix, NoteTag.tag < prefix + "\uffff")
+    rows = session.execute(
+        query.group_by(NoteTag.tag).order_by(func.count(NoteTag.note_id).desc(), NoteTag.tag)
+    ).mappings()
+    return [TagCount(**row) for row in rows]
+
+
+def tagged_note_ids(tags: List[str], match: str):
+    """Subquery of the ids of notes carrying all (or any) of tags"""
+    query = select(NoteTag.note_id).where(NoteTag.tag.in_(tags))
+    if match == "all":
+        query = query.group_by(NoteTag.note_id).having(
+            func.count(NoteTag.tag) == len(set(tags)))
+    return query
+
+
+def backfill_tags(engine: Engine, batch_size: int = 500):
+    """Extract hashtags from every note; run once when the tag table is new"""
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            notes = session.exec(
+                select(Note).where(Note.id > last_id).order_by(Note.id).limit(batch_size)
+            ).all()
+            if not notes:
+                return
+            for note in notes:
+                set_note_tags(session, note)
+            session.commit()
+            last_id = notes[-1].id
+            session.expunge_all()
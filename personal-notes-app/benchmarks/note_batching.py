@@ -0,0 +1,85 @@
+"""Compare note creation with and without group-commit batching
+
+Run from the personal-notes-app directory:
+
+    python -m benchmarks.note_batching [notes] [clients]
+
+Each mode starts from an empty SQLite database in a temporary directory.
+The clients are threads that create notes back to back, which is what a
+server's worker pool does under a burst of POST /notes/ requests. Notes
+go through the same code path as the endpoint, including search, tag and
+revision upkeep.
+"""
+import os
+import sys
+import tempfile
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.chdir(tempfile.mkdtemp(prefix="notes-bench-"))
+
+from app.batching import NoteWriteBatcher, create_note_now  # noqa: E402
+from app.database import create_db_and_tables, engine  # noqa: E402
+from app.models import NoteCreate  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+
+# Batches that fail are retried one by one; don't log each one
+logging.getLogger("note_batching").setLevel(logging.ERROR)
+
+
+def reset_database():
+    SQLModel.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS note_fts")
+    create_db_and_tables()
+
+
+def run(create, notes: int, clients: int):
+    payloads = [
+        NoteCreate(title=f"Note {i}", content=f"Clipped page {i} #inbox #clip{i % 10}")
+        for i in range(notes)
+    ]
+
+    def attempt(note):
+        try:
+            return create(note)
+        except OperationalError:
+            # "database is locked": the write lost the race for SQLite's lock
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        created = [note for note in pool.map(attempt, payloads) if note is not None]
+    elapsed = time.perf_counter() - started
+    assert len({note.id for note in created}) == len(created)
+    return elapsed, len(created)
+
+
+def report(name: str, notes: int, elapsed: float, created: int):
+    print(f"{name:<28} {created / elapsed:>8.0f} notes/s  "
+          f"{elapsed / notes * 1e3:>6.2f} ms/note  {notes - created:>5} failed")
+
+
+def main(notes: int, clients: int):
+    print(f"{notes} notes from {clients} concurrent clients")
+    reset_database()
+    report("unbatched", notes, *run(create_note_now, notes, clients))
+
+    for batch_size, wait_ms in ((100, 2), (100, 5), (100, 20)):
+        reset_database()
+        batcher = NoteWriteBatcher(batch_size, wait_ms)
+        batcher.start()
+        try:
+            result = run(lambda note: batcher.submit(note).result(), notes, clients)
+        finally:
+            batcher.stop()
+        report(f"batched ({batch_size} / {wait_ms:g} ms)", notes, *result)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 32,
+    )
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .models import Cohort, CohortStats, Grade, HistogramBin, Student, StudentAverage
+
+# Analytics configuration
+# Results are dropped on every write in this process; the TTL bounds how
+# stale they can get from writes made by other workers
+ANALYTICS_CACHE_SECONDS = float(os.getenv("ANALYTICS_CACHE_SECONDS", "60"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class AnalyticsCache:
+    """Computed cohort statistics, keyed by cohort and options
+
+    invalidate() is called after every student or grade write. A result
+    computed while a write happened is not stored, so the cache never
+    keeps numbers older than the last invalidation.
+    """
+
+    def __init__(self, ttl: float = ANALYTICS_CACHE_SECONDS, max_size: int = ANALYTICS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[tuple, Tuple[float, CohortStats]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: tuple) -> Optional[CohortStats]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, value: CohortStats, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+analytics_cache = AnalyticsCache()
+
+
+def _load_grades(session: Session, course: Optional[str], term: Optional[str]):
+    query = select(Grade.student_id, Grade.value)
+    if course is not None:
+        query = query.where(Grade.course == course)
+    if term is not None:
+        query = query.where(Grade.term == term)
+    rows = session.execute(query).all()
+    student_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return student_ids, values
+
+
+def compute_cohort_stats(session: Session, course: Optional[str], term: Optional[str],
+                         bins: int, top: int) -> CohortStats:
+    student_ids, values = _load_grades(session, course, term)
+    stats = CohortStats(
+        course=course, term=term, students=0, grades=int(values.size),
+        computed_at=datetime.now(),
+    )
+    if not values.size:
+        return stats
+
+    stats.mean = round(float(values.mean()), 2)
+    stats.median = round(float(np.median(values)), 2)
+    stats.std = round(float(values.std()), 2)
+    stats.min = float(values.min())
+    stats.max = float(values.max())
+    stats.percentiles = {
+        f"p{p}": round(float(value), 2)
+        for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+    }
+
+    counts, edges = np.histogram(values, bins=bins, range=(0, 100))
+    stats.histogram = [
+        HistogramBin(start=float(edges[i]), end=float(edges[i + 1]), count=int(counts[i]))
+        for i in range(len(counts))
+    ]
+
+    # Per-student averages: group by student id without a Python loop
+    students, inverse = np.unique(student_ids, return_inverse=True)
+    grade_counts = np.bincount(inverse)
+    averages = np.bincount(inverse, weights=values) / grade_counts
+    stats.students = int(students.size)
+
+    k = min(top, students.size)
+    if k:
+        best = np.argpartition(-averages, k - 1)[:k]
+        best = best[np.lexsort((students[best], -averages[best]))]
+        names = dict(session.execute(
+            select(Student.id, Student.name).where(Student.id.in_(students[best].tolist()))
+        ).all())
+        stats.top_students = [
+            StudentAverage(
+                student_id=int(students[i]),
+                name=names.get(int(students[i]), ""),
+                average=round(float(averages[i]), 2),
+                grades=int(grade_counts[i]),
+            )
+            for i in best
+        ]
+    return stats
+
+
+def cohort_stats(session: Session, course: Optional[str], term: Optional[str],
+                 bins: int = 10, top: int = 10) -> CohortStats:
+    key = (course, term, bins, top)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = analytics_cache.generation
+    stats = compute_cohort_stats(session, course, term, bins, top)
+    analytics_cache.put(key, stats, generation)
+    return stats
+
+
+def list_cohorts(session: Session) -> List[Cohort]:
+    rows = session.execute(
+        select(
+            Grade.course,
+            Grade.term,
+            func.count(func.distinct(Grade.student_id)).label("students"),
+            func.count(Grade.id).label("grades"),
+        )
+        .group_by(Grade.course, Grade.term)
+        .order_by(Grade.course, Grade.term)
+    ).mappings()
+    return [Cohort(**row) for row in rows]
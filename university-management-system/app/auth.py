@@ -1,5 +1,10 @@
 import json
+import logging
 import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer
 from .models import User
@@ -7,27 +12,71 @@ from .models import User
 # Security
 security = HTTPBearer()
 
+# User registry configuration
+USERS_FILE = os.getenv("USERS_FILE", "users.json")
+# How often, at most, requests check users.json for changes
+USERS_RELOAD_CHECK_SECONDS = float(os.getenv("USERS_RELOAD_CHECK_SECONDS", "2"))
+
+DEFAULT_USERS = [
+    {"username": "admin", "password": "admin123", "is_active": True},
+    {"username": "user", "password": "user123", "is_active": True}
+]
+
+logger = logging.getLogger("auth")
+
+
+class UserRegistry:
+    """Users from users.json, kept in memory
+
+    The file is parsed once and again only when its mtime or size changes.
+    Even that check (a stat call) runs at most once per
+    USERS_RELOAD_CHECK_SECONDS, so a lookup is normally one dict access.
+    """
+
+    def __init__(self, path: str = USERS_FILE, check_seconds: float = USERS_RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._users: Dict[str, User] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[User]:
+        if time.monotonic() - self._checked >= self.check_seconds:
+            self.refresh()
+        return self._users.get(username)
+
+    def refresh(self, force: bool = False) -> int:
+        """Reload the file if it changed (or always, with force); returns the user count"""
+        with self._lock:
+            self._checked = time.monotonic()
+            if not os.path.exists(self.path):
+                # Create default users file
+                with open(self.path, "w") as f:
+                    json.dump(DEFAULT_USERS, f, indent=2)
+
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if force or signature != self._signature:
+                try:
+                    with open(self.path, "r") as f:
+                        users_data = json.load(f)
+                    users = {user["username"]: User(**user) for user in users_data}
+                except (ValueError, KeyError, TypeError) as e:
+                    # Probably caught mid-write; keep the users we have and
+                    # try again on the next check
+                    logger.error(f"Could not load {self.path}: {e}")
+                else:
+                    self._users = users
+                    self._signature = signature
+            return len(self._users)
+
 
-def load_users():
-    users_file = "users.json"
-    if os.path.exists(users_file):
-        with open(users_file, "r") as f:
-            users_data = json.load(f)
-            return {user["username"]: User(**user) for user in users_data}
-    else:
-        # Create default users file
-        default_users = [
-            {"username": "admin", "password": "admin123", "is_active": True},
-            {"username": "user", "password": "user123", "is_active": True}
-        ]
-        with open(users_file, "w") as f:
-            json.dump(default_users, f, indent=2)
-        return {user["username"]: User(**user) for user in default_users}
+user_registry = UserRegistry()
 
 
 def authenticate_user(username: str, password: str) -> User | None:
-    users = load_users()
-    user = users.get(username)
+    user = user_registry.get(username)
     if user and user.password == password and user.is_active:
         return user
     return None
@@ -35,9 +84,8 @@ def authenticate_user(username: str, password: str) -> User | None:
 
 def get_current_user(token: str = Depends(security)) -> User:
     # Simple token validation - in production, use JWT
-    users = load_users()
     username = token.credentials  # Using username as token for simplicity
-    user = users.get(username)
+    user = user_registry.get(username)
 
     if not user or not user.is_active:
         raise HTTPException(
@@ -1,15 +1,118 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel, Session, select
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+import logging
 import os
 
+from .engine import build_engine
+from .grades import migrate_json_grades
+from .search import install_search_index
+from .models import Grade, Student, fold_name, normalize_email
+
+logger = logging.getLogger("database")
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./university.db")
 
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = build_engine(DATABASE_URL)
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all only builds indexes together with new tables
+    for index in Grade.__table__.indexes:
+        index.create(engine, checkfirst=True)
+    migrate_student_name_lower()
+    migrate_student_emails()
+    create_student_indexes()
+    install_search_index(engine)
+    migrate_json_grades(engine)
+
+
+def migrate_student_name_lower(batch_size: int = 500) -> int:
+    """Add the name_lower column to older databases and fill it in"""
+    columns = {column["name"] for column in inspect(engine).get_columns("student")}
+    if "name_lower" in columns:
+        return 0
+    with engine.begin() as connection:
+        connection.execute(text(
+            "ALTER TABLE student ADD COLUMN name_lower VARCHAR NOT NULL DEFAULT ''"))
+        # The old index of that name is on lower(name); the new one is
+        # created on the column by create_student_indexes
+        connection.execute(text("DROP INDEX IF EXISTS ix_student_name_lower"))
+
+    updated, last_id = 0, 0
+    with Session(engine) as session:
+        while True:
+            students = session.exec(
+                select(Student).where(Student.id > last_id).order_by(Student.id).limit(batch_size)
+            ).all()
+            if not students:
+                return updated
+            for student in students:
+                student.name_lower = fold_name(student.name)
+            session.commit()
+            updated += len(students)
+            last_id = students[-1].id
+            session.expunge_all()
+
+
+def migrate_student_emails() -> int:
+    """Lowercase stored emails, which are now compared in lowercase
+
+    An email whose lowercase form another student already has is left as
+    it is, and retried at every startup until the two are sorted out.
+    """
+    changed, conflicts = 0, []
+    with engine.begin() as connection:
+        rows = connection.execute(text(
+            "SELECT id, email FROM student WHERE email <> lower(email)")).all()
+        for student_id, email in rows:
+            target = normalize_email(email)
+            taken = connection.execute(
+                text("SELECT 1 FROM student WHERE email = :email"), {"email": target}).first()
+            if taken:
+                conflicts.append(email)
+                continue
+            connection.execute(
+                text("UPDATE student SET email = :email WHERE id = :id"),
+                {"email": target, "id": student_id})
+            changed += 1
+    if conflicts:
+        logger.warning(
+            f"{len(conflicts)} student emails differ only in case from another "
+            f"student's and were not lowercased: {', '.join(conflicts[:10])}")
+    return changed
+
+
+def create_student_indexes():
+    """Add the student indexes to an existing student table
+
+    A table that already holds duplicate emails can't take the unique email
+    index; it gets a plain one instead, so lookups by email stay indexed
+    until the duplicates are cleaned up. The endpoints refuse new duplicates
+    either way.
+    """
+    for index in Student.__table__.indexes:
+        try:
+            # IF NOT EXISTS in the statement rather than checkfirst, which
+            # would reflect the whole table once per index
+            with engine.begin() as connection:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+        except IntegrityError:
+            logger.warning(
+                "Duplicate student emails found; the unique email index is "
+                "retried at every startup until they are fixed")
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_student_email ON student (email)"))
+        else:
+            if index.name == "ux_student_email":
+                # The stand-in index from a startup with duplicates is redundant now
+                with engine.begin() as connection:
+                    connection.execute(text("DROP INDEX IF EXISTS ix_student_email"))
 
 
 def get_session():
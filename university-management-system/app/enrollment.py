@@ -0,0 +1,230 @@
+import codecs
+import csv
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from .database import engine
+from .grades import UNASSIGNED_COURSE
+from .models import (
+    Grade, Student, StudentCreate, StudentImportError, StudentImportReport, fold_name,
+)
+
+# Import configuration
+IMPORT_BATCH_SIZE = int(os.getenv("STUDENT_IMPORT_BATCH_SIZE", "500"))
+# Errors past this many are counted but left out of the report
+IMPORT_MAX_ERRORS = int(os.getenv("STUDENT_IMPORT_MAX_ERRORS", "1000"))
+# Largest CSV record a quoted field may grow to across lines
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("STUDENT_IMPORT_MAX_RECORD_BYTES", "65536"))
+
+CSV_COLUMNS = ("name", "age", "email", "grades")
+
+logger = logging.getLogger("enrollment")
+
+# (line number, parsed row or None, error message if the row didn't parse)
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered text lines of a streamed body, without holding the body"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending, number = "", 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            number += 1
+            yield number, line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending
+
+
+async def ndjson_records(lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Record]:
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, row, None
+
+
+async def _with_end(lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Optional[Tuple[int, str]]]:
+    async for line in lines:
+        yield line
+    yield None
+
+
+async def csv_records(lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Record]:
+    """Rows of a CSV body with a header line (name, age, email, grades)
+
+    grades holds the values separated by ";" or spaces. A quoted field may
+    span lines: physical lines are joined until the quotes balance. A
+    record left open at the end of the body, or past
+    IMPORT_MAX_RECORD_BYTES, almost always has a stray quote; its first
+    line is reported and reading resumes from the line after it.
+    """
+    header = None
+    parts: List[Tuple[int, str]] = []
+    quotes = size = 0
+    pending: Deque[Optional[Tuple[int, str]]] = deque()
+    async for item in _with_end(lines):
+        pending.append(item)
+        while pending:
+            item = pending.popleft()
+            if item is not None:
+                parts.append(item)
+                quotes += item[1].count('"')
+                if quotes % 2:
+                    size += len(item[1].encode()) + 1
+                    if size <= IMPORT_MAX_RECORD_BYTES:
+                        continue
+            if quotes % 2:
+                # End of the body, or over the cap, with a quote still open
+                yield parts[0][0], None, "Unterminated quoted field"
+                pending.extendleft(reversed(parts[1:] + ([None] if item is None else [])))
+                parts, quotes, size = [], 0, 0
+                continue
+            if not parts:
+                continue
+
+            start = parts[0][0]
+            text = "\n".join(line for _, line in parts) + "\n"
+            parts, quotes, size = [], 0, 0
+            if not text.strip():
+                continue
+            [values] = csv.reader([text])
+
+            if header is None:
+                header = [name.strip().lower() for name in values]
+                missing = [name for name in CSV_COLUMNS[:3] if name not in header]
+                if missing:
+                    raise ValueError(f"CSV header is missing {', '.join(missing)}")
+                continue
+
+            row = {
+                name: value.strip()
+                for name, value in zip(header, values)
+                if name in CSV_COLUMNS and value.strip()
+            }
+            if "grades" in row:
+                row["grades"] = row["grades"].replace(";", " ").split()
+            yield start, row, None
+
+
+def _error_messages(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    ]
+
+
+class StudentImport:
+    """Validates and inserts streamed rows one batch per transaction"""
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE, max_errors: int = IMPORT_MAX_ERRORS):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.report = StudentImportReport()
+
+    async def run(self, records: AsyncIterator[Record]) -> StudentImportReport:
+        batch: List[Record] = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                await run_in_threadpool(self.import_batch, batch)
+                batch = []
+        if batch:
+            await run_in_threadpool(self.import_batch, batch)
+        return self.report
+
+    def fail(self, line: int, email: Optional[str], errors: List[str]):
+        self.report.failed += 1
+        if len(self.report.errors) < self.max_errors:
+            self.report.errors.append(StudentImportError(line=line, email=email, errors=errors))
+        else:
+            self.report.errors_truncated = True
+
+    def import_batch(self, records: List[Record]):
+        """Validate one batch and insert its good rows; runs in a worker thread"""
+        valid: Dict[str, Tuple[int, StudentCreate]] = {}
+        for line, row, error in records:
+            if row is None:
+                self.fail(line, None, [error])
+                continue
+            try:
+                student = StudentCreate.parse_obj(row)
+            except ValidationError as e:
+                email = row.get("email")
+                self.fail(line, email if isinstance(email, str) else None, _error_messages(e))
+                continue
+            if student.email in valid:
+                self.fail(line, student.email, [f"email: duplicate of line {valid[student.email][0]}"])
+                continue
+            valid[student.email] = (line, student)
+
+        if not valid:
+            return
+        with Session(engine) as session:
+            # One indexed lookup for the whole batch
+            existing = set(session.exec(
+                select(Student.email).where(Student.email.in_(list(valid)))
+            ).all())
+            rows = []
+            for email, (line, student) in valid.items():
+                if email in existing:
+                    self.fail(line, email, ["email: already registered"])
+                else:
+                    rows.append((line, student))
+            if not rows:
+                return
+
+            try:
+                self._insert(session, [student for _, student in rows])
+            except IntegrityError as e:
+                # Someone registered one of these emails meanwhile
+                session.rollback()
+                logger.warning(f"Import batch of {len(rows)} failed, retrying one by one: {e}")
+                for line, student in rows:
+                    try:
+                        self._insert(session, [student])
+                    except IntegrityError:
+                        session.rollback()
+                        self.fail(line, student.email, ["email: already registered"])
+
+    def _insert(self, session: Session, students: List[StudentCreate]):
+        # Rows are validated already, so skip building ORM objects (which
+        # would validate every email again) and insert with executemany
+        session.execute(insert(Student), [
+            {"name": student.name, "name_lower": fold_name(student.name), "age": student.age,
+             "email": student.email, "grades": "[]"}
+            for student in students
+        ])
+        ids = dict(session.exec(
+            select(Student.email, Student.id).where(Student.email.in_([s.email for s in students]))
+        ).all())
+        now = datetime.now()
+        grades = [
+            {"student_id": ids[student.email], "course": UNASSIGNED_COURSE, "value": value,
+             "term": None, "created_at": now}
+            for student in students
+            for value in student.grades or []
+        ]
+        if grades:
+            session.execute(insert(Grade), grades)
+        session.commit()
+        self.report.imported += len(students)
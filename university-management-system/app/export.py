@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+import os
+from typing import Iterator
+
+from sqlmodel import Session, select
+
+from .database import engine
+from .grades import grade_values
+from .models import Student
+
+# Export configuration
+# Rows fetched from the cursor, and written to the response, per chunk
+EXPORT_CHUNK_ROWS = int(os.getenv("STUDENT_EXPORT_CHUNK_ROWS", "1000"))
+
+EXPORT_COLUMNS = ["id", "name", "age", "email"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_students(format: str, include_grades: bool = False) -> Iterator[str]:
+    """Every student as NDJSON lines or CSV rows, one chunk at a time
+
+    Runs its own session on a streaming cursor (a server-side cursor on
+    PostgreSQL), so memory stays at one chunk whatever the table size.
+    The output uses the same fields as POST /students/import, with CSV
+    grades separated by ";".
+    """
+    columns = EXPORT_COLUMNS + (["grades"] if include_grades else [])
+    if format == "csv":
+        yield _csv_chunk([columns])
+
+    with Session(engine) as session:
+        rows = session.execute(
+            select(Student.id, Student.name, Student.age, Student.email)
+            .order_by(Student.id)
+            .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+        )
+        for chunk in rows.partitions():
+            records = [list(row) for row in chunk]
+            if include_grades:
+                grades = grade_values(session, [row.id for row in chunk])
+                for record in records:
+                    values = grades[record[0]]
+                    record.append(
+                        ";".join(str(value) for value in values) if format == "csv" else values)
+
+            if format == "csv":
+                yield _csv_chunk(records)
+            else:
+                yield "".join(json.dumps(dict(zip(columns, record))) + "\n" for record in records)
+
+
+def _csv_chunk(records: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(records)
+    return buffer.getvalue()
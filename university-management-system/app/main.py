@@ -1,14 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
+from pydantic import EmailStr
 import os
 
-from .models import Student, StudentCreate, StudentUpdate, User, UserLogin
+from .models import (
+    Student, StudentCreate, StudentRead, StudentUpdate, User, UserLogin,
+    StudentImportReport, StudentSearchPage, Grade, GradeCreate, GradeSummary, Cohort, CohortStats,
+)
+from .grades import add_grade_values, delete_student_grades, grade_summary, student_reads
+from .analytics import analytics_cache, cohort_stats, list_cohorts
+from .search import find_students
+from .export import MEDIA_TYPES, export_students
+from .enrollment import StudentImport, csv_records, ndjson_records, read_lines
 from .database import create_db_and_tables, get_session
-from .auth import authenticate_user, get_current_user
-from .middleware import LoggingMiddleware
+from .auth import authenticate_user, get_current_user, user_registry
+from .middleware import LoggingMiddleware, request_log
 
 # Create FastAPI app
 app = FastAPI(title="University Management System", version="1.0.0")
@@ -34,8 +45,16 @@ security = HTTPBearer()
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    user_registry.refresh()
     # Create logs directory if it doesn't exist
     os.makedirs("logs", exist_ok=True)
+    request_log.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Writes the last rollup and drains the log queue
+    request_log.stop()
 
 # Authentication endpoint
 
@@ -50,23 +69,74 @@ def login(user_data: UserLogin):
         )
     return {"access_token": user.username, "token_type": "bearer"}
 
+
+@app.post("/auth/reload")
+def reload_users(current_user: User = Depends(get_current_user)):
+    """Re-read users.json now instead of waiting for the next change check"""
+    count = user_registry.refresh(force=True)
+    return {"message": f"Loaded {count} users"}
+
 # Student CRUD endpoints
 
 
-@app.post("/students/", response_model=Student)
+def _check_email_free(session: Session, email: str, student_id: Optional[int] = None):
+    # Checked here as well as by the unique index, which a database with
+    # legacy duplicate emails doesn't have yet
+    query = select(Student.id).where(Student.email == email)
+    if student_id is not None:
+        query = query.where(Student.id != student_id)
+    if session.exec(query.limit(1)).first() is not None:
+        raise HTTPException(status_code=409, detail="Email already registered")
+
+
+@app.post("/students/", response_model=StudentRead)
 def create_student(
     student: StudentCreate,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    db_student = Student.from_orm(student)
+    _check_email_free(session, student.email)
+    db_student = Student(**student.dict(exclude={"grades"}))
     session.add(db_student)
+    try:
+        session.flush()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Email already registered")
+    add_grade_values(session, db_student.id, student.grades or [])
     session.commit()
+    analytics_cache.invalidate()
     session.refresh(db_student)
-    return db_student
+    return student_reads(session, [db_student])[0]
 
 
-@app.get("/students/", response_model=List[Student])
+@app.post("/students/import", response_model=StudentImportReport)
+async def import_students(
+    request: Request,
+    format: Optional[str] = Query(None, regex="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Enroll students from a streamed CSV or NDJSON body
+
+    Send the file itself as the body; the format comes from ?format or the
+    Content-Type. Rows are validated like POST /students/ and inserted a
+    batch per transaction; rows that fail are listed by line in the report.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    lines = read_lines(request.stream())
+    records = csv_records(lines) if format == "csv" else ndjson_records(lines)
+
+    student_import = StudentImport()
+    try:
+        return await student_import.run(records)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if student_import.report.imported:
+            analytics_cache.invalidate()
+
+
+@app.get("/students/", response_model=List[StudentRead])
 def read_students(
     skip: int = 0,
     limit: int = 100,
@@ -74,10 +144,55 @@ def read_students(
     current_user: User = Depends(get_current_user)
 ):
     students = session.exec(select(Student).offset(skip).limit(limit)).all()
-    return students
+    return student_reads(session, students)
+
+
+@app.get("/students/export")
+def export_students_file(
+    format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+    grades: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every student as NDJSON or CSV, optionally with their grades"""
+    return StreamingResponse(
+        export_students(format, include_grades=grades),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="students.{format}"'},
+    )
 
 
-@app.get("/students/{student_id}", response_model=Student)
+@app.get("/students/search", response_model=StudentSearchPage)
+def search_students(
+    email: Optional[EmailStr] = None,
+    name: Optional[str] = Query(
+        None, min_length=1, max_length=100, description="Case-insensitive name prefix"),
+    q: Optional[str] = Query(
+        None, min_length=1, max_length=200,
+        description="Words to find in name or email; end one with * to match a prefix"),
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor from the previous page"),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Find students by exact email, name prefix, text and age range, in id order"""
+    after = None
+    if cursor:
+        if not (cursor.isascii() and cursor.isdigit()):
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        after = int(cursor)
+    students = find_students(
+        session, email=email, name=name, query=q,
+        min_age=min_age, max_age=max_age, after=after, limit=limit)
+    return StudentSearchPage(
+        results=student_reads(session, students),
+        next_cursor=str(students[-1].id) if len(students) == limit else None,
+    )
+
+
+@app.get("/students/{student_id}", response_model=StudentRead)
 def read_student(
     student_id: int,
     session: Session = Depends(get_session),
@@ -87,10 +202,10 @@ def read_student(
     student = session.get(Student, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
-    return student
+    return student_reads(session, [student])[0]
 
 
-@app.put("/students/{student_id}", response_model=Student)
+@app.put("/students/{student_id}", response_model=StudentRead)
 def update_student(
     student_id: int,
     student: StudentUpdate,
@@ -103,13 +218,23 @@ def update_student(
         raise HTTPException(status_code=404, detail="Student not found")
 
     student_data = student.dict(exclude_unset=True)
+    if student_data.get("email") is not None:
+        _check_email_free(session, student_data["email"], student_id)
+    grades = student_data.pop("grades", None)
     for key, value in student_data.items():
         setattr(db_student, key, value)
+    if grades is not None:
+        delete_student_grades(session, student_id)
+        add_grade_values(session, student_id, grades)
 
     session.add(db_student)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Email already registered")
+    analytics_cache.invalidate()
     session.refresh(db_student)
-    return db_student
+    return student_reads(session, [db_student])[0]
 
 
 @app.delete("/students/{student_id}")
@@ -123,10 +248,107 @@ def delete_student(
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
+    delete_student_grades(session, student_id)
     session.delete(student)
     session.commit()
+    analytics_cache.invalidate()
     return {"message": "Student deleted successfully"}
 
+# Grade endpoints
+
+
+def _get_student_or_404(session: Session, student_id: int) -> Student:
+    student = session.get(Student, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student
+
+
+@app.post("/students/{student_id}/grades", response_model=Grade, status_code=201)
+def add_grade(
+    student_id: int,
+    grade: GradeCreate,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Record one grade without touching the student's other grades"""
+    _get_student_or_404(session, student_id)
+    db_grade = Grade(student_id=student_id, **grade.dict())
+    session.add(db_grade)
+    session.commit()
+    analytics_cache.invalidate()
+    session.refresh(db_grade)
+    return db_grade
+
+
+@app.get("/students/{student_id}/grades", response_model=List[Grade])
+def read_grades(
+    student_id: int,
+    course: Optional[str] = None,
+    term: Optional[str] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    _get_student_or_404(session, student_id)
+    query = select(Grade).where(Grade.student_id == student_id)
+    if course is not None:
+        query = query.where(Grade.course == course)
+    if term is not None:
+        query = query.where(Grade.term == term)
+    return session.exec(query.order_by(Grade.id)).all()
+
+
+@app.get("/students/{student_id}/grades/summary", response_model=GradeSummary)
+def read_grade_summary(
+    student_id: int,
+    term: Optional[str] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Average and GPA (4.0 scale), overall and per course"""
+    _get_student_or_404(session, student_id)
+    return grade_summary(session, student_id, term)
+
+
+@app.delete("/students/{student_id}/grades/{grade_id}")
+def delete_grade(
+    student_id: int,
+    grade_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    grade = session.get(Grade, grade_id)
+    if not grade or grade.student_id != student_id:
+        raise HTTPException(status_code=404, detail="Grade not found")
+    session.delete(grade)
+    session.commit()
+    analytics_cache.invalidate()
+    return {"message": "Grade deleted successfully"}
+
+# Analytics endpoints
+
+
+@app.get("/analytics/cohorts", response_model=List[Cohort])
+def read_cohorts(
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Every (course, term) with its student and grade counts"""
+    return list_cohorts(session)
+
+
+@app.get("/analytics/grades", response_model=CohortStats)
+def read_grade_analytics(
+    course: Optional[str] = None,
+    term: Optional[str] = None,
+    bins: int = Query(10, ge=1, le=100),
+    top: int = Query(10, ge=0, le=100),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Grade statistics for a cohort; leave out course or term to span all of them"""
+    return cohort_stats(session, course, term, bins, top)
+
 # Health check endpoint
 
 
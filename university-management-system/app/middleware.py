@@ -1,5 +1,10 @@
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+import queue
+import random
+import threading
 import time
 import logging
 import os
@@ -10,49 +15,203 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Request logging configuration
+# "all" logs every request; "sampled" always logs errors and slow requests
+# and only REQUEST_LOG_SAMPLE_RATE of the rest
+REQUEST_LOG_MODE = os.getenv("REQUEST_LOG_MODE", "all").lower()
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", "0.01"))
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "500"))
+# Per-route rollups are logged this often; 0 turns them off
+REQUEST_LOG_ROLLUP_SECONDS = float(os.getenv("REQUEST_LOG_ROLLUP_SECONDS", "60"))
+REQUEST_LOG_FILE = os.getenv("REQUEST_LOG_FILE", "logs/requests.log")
+
+# Latencies kept per route and interval for the percentiles
+ROLLUP_SAMPLE_SIZE = 1000
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app):
-        super().__init__(app)
-        # Ensure logs directory exists
-        os.makedirs("logs", exist_ok=True)
 
-        # Configure file handler
-        self.file_handler = logging.FileHandler("logs/requests.log")
-        self.file_handler.setLevel(logging.INFO)
+class RouteStats:
+    """Counts and a reservoir sample of latencies for one route"""
 
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s')
-        self.file_handler.setFormatter(formatter)
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: List[float] = []
+
+    def add(self, duration_ms: float, error: bool):
+        self.count += 1
+        self.errors += error
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        if len(self.samples) < ROLLUP_SAMPLE_SIZE:
+            self.samples.append(duration_ms)
+        else:
+            slot = random.randrange(self.count)
+            if slot < ROLLUP_SAMPLE_SIZE:
+                self.samples[slot] = duration_ms
+
+    def percentile(self, ordered: List[float], p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self) -> str:
+        ordered = sorted(self.samples)
+        return (
+            f"Count: {self.count} | "
+            f"Errors: {self.errors} | "
+            f"Avg: {self.total_ms / self.count:.1f}ms | "
+            f"P50: {self.percentile(ordered, 50):.1f}ms | "
+            f"P95: {self.percentile(ordered, 95):.1f}ms | "
+            f"P99: {self.percentile(ordered, 99):.1f}ms | "
+            f"Max: {self.max_ms:.1f}ms"
+        )
 
-        # Create logger
+
+class RequestLog:
+    """Request log lines and per-route rollups, written off the event loop
+
+    Records go through a QueueHandler; a QueueListener thread does the
+    formatting and file writes, so a request only pays for a queue put.
+    Rollups are logged by a timer thread, so a quiet interval still gets
+    its line on time.
+    """
+
+    def __init__(self, path: str = REQUEST_LOG_FILE, mode: str = REQUEST_LOG_MODE,
+                 sample_rate: float = REQUEST_LOG_SAMPLE_RATE,
+                 slow_ms: float = REQUEST_LOG_SLOW_MS,
+                 rollup_seconds: float = REQUEST_LOG_ROLLUP_SECONDS):
+        self.path = path
+        self.sampled = mode == "sampled"
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.rollup_seconds = rollup_seconds
         self.logger = logging.getLogger("request_logger")
-        self.logger.addHandler(self.file_handler)
         self.logger.setLevel(logging.INFO)
+        self._listener = None
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._rollup_thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            file_handler = logging.FileHandler(self.path)
+            file_handler.setLevel(logging.INFO)
+            file_handler.setFormatter(logging.Formatter(
+                '%(asctime)s - %(levelname)s - %(message)s'))
+
+            # The console copy goes through the listener too, instead of
+            # propagating to the root handler on the event loop
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(file_handler.formatter)
+
+            log_queue: queue.Queue = queue.Queue()
+            self._handler = QueueHandler(log_queue)
+            self.logger.addHandler(self._handler)
+            self.logger.propagate = False
+            self._listener = QueueListener(log_queue, file_handler, console_handler)
+            self._listener.start()
+
+            if self.rollup_seconds > 0:
+                self._stopping = threading.Event()
+                self._rollup_thread = threading.Thread(
+                    target=self._run_rollups, args=(self._stopping,),
+                    name="request-log-rollups", daemon=True)
+                self._rollup_thread.start()
+
+    def _run_rollups(self, stopping: threading.Event):
+        while not stopping.wait(self.rollup_seconds):
+            self.flush_rollups()
+
+    def stop(self):
+        """Log the last rollup and wait for queued lines to reach the file"""
+        with self._lock:
+            rollup_thread, self._rollup_thread = self._rollup_thread, None
+            self._stopping.set()
+        if rollup_thread is not None:
+            rollup_thread.join()
+        self.flush_rollups()
+        with self._lock:
+            if self._listener is None:
+                return
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self.logger.removeHandler(self._handler)
+            self.logger.propagate = True
+            self._listener = None
+
+    def should_log(self, status_code: int, duration_ms: float) -> bool:
+        if not self.sampled or status_code >= 500 or duration_ms >= self.slow_ms:
+            return True
+        return random.random() < self.sample_rate
+
+    def record(self, method: str, route_path: str, status_code: int, duration_ms: float):
+        if self.rollup_seconds <= 0:
+            return
+        with self._lock:
+            stats = self._routes.get((method, route_path))
+            if stats is None:
+                stats = self._routes[(method, route_path)] = RouteStats()
+            stats.add(duration_ms, status_code >= 500)
+
+    def flush_rollups(self):
+        with self._lock:
+            routes, self._routes = self._routes, {}
+        for (method, route_path), stats in sorted(routes.items()):
+            self.logger.info(f"Rollup: {method} {route_path} | {stats.summary()}")
+
+
+request_log = RequestLog()
+
+
+class LoggingMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app):
+        super().__init__(app)
+        request_log.start()
 
     async def dispatch(self, request: Request, call_next):
         """Log request details and process time"""
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         # Get client IP
         client_ip = request.client.host if request.client else "unknown"
 
-        # Process request
-        response = await call_next(request)
-
-        # Calculate process time
-        process_time = time.time() - start_time
+        # Process request; an unhandled error is answered with a 500
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            # Calculate process time
+            process_time = time.perf_counter() - start_time
+            duration_ms = process_time * 1000
 
-        # Log request details
-        log_message = (
-            f"Method: {request.method} | "
-            f"URL: {request.url} | "
-            f"IP: {client_ip} | "
-            f"Status: {response.status_code} | "
-            f"Process Time: {process_time:.4f}s"
-        )
+            # Roll up by route template so /students/1 and /students/2 share one entry
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            request_log.record(request.method, route_path, status_code, duration_ms)
 
-        self.logger.info(log_message)
+            # Log request details
+            if request_log.should_log(status_code, duration_ms):
+                log_message = (
+                    f"Method: {request.method} | "
+                    f"URL: {request.url} | "
+                    f"IP: {client_ip} | "
+                    f"Status: {status_code} | "
+                    f"Process Time: {process_time:.4f}s"
+                )
+                if status_code >= 500:
+                    request_log.logger.error(log_message)
+                elif duration_ms >= request_log.slow_ms:
+                    request_log.logger.warning(log_message)
+                else:
+                    request_log.logger.info(log_message)
 
         return response
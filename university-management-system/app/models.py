@@ -1,56 +1,172 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional, List
-from pydantic import BaseModel, EmailStr
-import json
+from sqlalchemy import Index, event
+from typing import Optional, List, Dict
+from pydantic import BaseModel, EmailStr, validator
+from datetime import datetime
 
 # Student Models
 
 
+def normalize_email(value):
+    # Stored and compared in lowercase, so the duplicate check and the
+    # unique index agree on which emails are the same
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
 class StudentBase(SQLModel):
     name: str
     age: int
     email: EmailStr
-    grades: str = Field(default="[]")  # Store as JSON string
+
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
 
 
 class Student(StudentBase, table=True):
+    __table_args__ = (
+        Index("ux_student_email", "email", unique=True),
+        # Case-insensitive name prefix search is a range scan on name_lower
+        Index("ix_student_name_lower", "name_lower"),
+        # Age bands; a single age is read in id order straight from the index
+        Index("ix_student_age_id", "age", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Legacy JSON list of grades; migrated into Grade rows and left as "[]"
+    grades: str = Field(default="[]")
+    # Folded in Python, not with the database's lower(), which leaves
+    # non-ASCII letters alone on SQLite; kept in step with name
+    name_lower: str = Field(default="")
 
-    @property
-    def grades_list(self) -> List[float]:
-        """Convert grades JSON string to list"""
-        try:
-            return json.loads(self.grades)
-        except (json.JSONDecodeError, TypeError):
-            return []
 
-    @grades_list.setter
-    def grades_list(self, value: List[float]):
-        """Convert grades list to JSON string"""
-        self.grades = json.dumps(value)
+def fold_name(name: str) -> str:
+    """The case-folded form names are stored and searched in"""
+    return name.casefold()
+
+
+@event.listens_for(Student, "before_insert")
+@event.listens_for(Student, "before_update")
+def _set_student_name_lower(mapper, connection, student):
+    student.name_lower = fold_name(student.name)
 
 
 class StudentCreate(StudentBase):
+    # Recorded as grades for the "unassigned" course
     grades: Optional[List[float]] = []
 
-    def dict(self, **kwargs):
-        d = super().dict(**kwargs)
-        if 'grades' in d and isinstance(d['grades'], list):
-            d['grades'] = json.dumps(d['grades'])
-        return d
+
+class StudentRead(StudentBase):
+    id: int
+    grades: List[float] = []
 
 
 class StudentUpdate(SQLModel):
     name: Optional[str] = None
     age: Optional[int] = None
     email: Optional[EmailStr] = None
+    # Replaces all of the student's grades
     grades: Optional[List[float]] = None
 
-    def dict(self, **kwargs):
-        d = super().dict(**kwargs)
-        if 'grades' in d and d['grades'] is not None and isinstance(d['grades'], list):
-            d['grades'] = json.dumps(d['grades'])
-        return d
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
+
+class StudentSearchPage(SQLModel):
+    results: List[StudentRead]
+    # Pass back as ?cursor= for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+class StudentImportError(SQLModel):
+    # Line of the body where the row starts
+    line: int
+    email: Optional[str] = None
+    errors: List[str]
+
+
+class StudentImportReport(SQLModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[StudentImportError] = []
+    # More rows failed than are listed in errors
+    errors_truncated: bool = False
+
+# Grade Models
+
+
+class GradeBase(SQLModel):
+    course: str = Field(min_length=1, max_length=100)
+    value: float = Field(ge=0, le=100)
+    term: Optional[str] = Field(default=None, max_length=20)
+
+
+class Grade(GradeBase, table=True):
+    __table_args__ = (
+        Index("ix_grade_course_term", "course", "term"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="student.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class GradeCreate(GradeBase):
+    pass
+
+
+class CourseGradeSummary(SQLModel):
+    course: str
+    count: int
+    average: float
+    gpa: float
+
+
+class GradeSummary(SQLModel):
+    student_id: int
+    term: Optional[str] = None
+    count: int
+    average: Optional[float] = None
+    gpa: Optional[float] = None
+    courses: List[CourseGradeSummary] = []
+
+# Analytics Models
+
+
+class HistogramBin(SQLModel):
+    start: float
+    end: float
+    count: int
+
+
+class StudentAverage(SQLModel):
+    student_id: int
+    name: str
+    average: float
+    grades: int
+
+
+class CohortStats(SQLModel):
+    # None means every course (or term)
+    course: Optional[str] = None
+    term: Optional[str] = None
+    students: int
+    grades: int
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    percentiles: Dict[str, float] = {}
+    histogram: List[HistogramBin] = []
+    top_students: List[StudentAverage] = []
+    computed_at: datetime
+
+
+class Cohort(SQLModel):
+    course: str
+    term: Optional[str] = None
+    students: int
+    grades: int
 
 # User Models for Authentication
 
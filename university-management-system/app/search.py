@@ -0,0 +1,122 @@
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, column, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from .models import Student, fold_name, normalize_email
+
+# Full-text search over student name and email: an external-content FTS5
+# table on SQLite and a GIN expression index on PostgreSQL. The FTS5 table
+# is kept in step by triggers rather than by the endpoints, so bulk imports
+# and any other writer are covered. Other databases get a substring scan.
+TS_CONFIG = "simple"
+TS_DOCUMENT = f"to_tsvector('{TS_CONFIG}', student.name || ' ' || student.email)"
+
+_TERM_RE = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS student_fts_insert AFTER INSERT ON student BEGIN "
+    "INSERT INTO student_fts(rowid, name, email) VALUES (new.id, new.name, new.email); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_delete AFTER DELETE ON student BEGIN "
+    "INSERT INTO student_fts(student_fts, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_update AFTER UPDATE OF name, email ON student BEGIN "
+    "INSERT INTO student_fts(student_fts, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO student_fts(rowid, name, email) VALUES (new.id, new.name, new.email); "
+    "END",
+]
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def install_search_index(engine: Engine):
+    """Create the full-text index; a newly created FTS5 table is filled from the students"""
+    with engine.begin() as connection:
+        if _dialect(engine) == "sqlite":
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_fts'"
+            )).first()
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS student_fts USING fts5("
+                "name, email, content='student', content_rowid='id', tokenize='unicode61')"
+            ))
+            for trigger in SQLITE_TRIGGERS:
+                connection.execute(text(trigger))
+            if not exists:
+                connection.execute(text("INSERT INTO student_fts(student_fts) VALUES ('rebuild')"))
+        elif _dialect(engine) == "postgresql":
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_student_search ON student USING gin ({TS_DOCUMENT})"
+            ))
+
+
+def parse_query(query: str) -> List[Tuple[str, bool]]:
+    """Split a query into (term, is_prefix) pairs; "sam*" is a prefix term"""
+    return [(term.lower(), bool(star)) for term, star in _TERM_RE.findall(query)]
+
+
+def _prefix_end(prefix: str) -> str:
+    # Smallest string above every string that starts with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _text_match(session: Session, terms: List[Tuple[str, bool]]):
+    if _dialect(session.get_bind()) == "sqlite":
+        match = " ".join(f'"{term}"' + ("*" if prefix else "") for term, prefix in terms)
+        return Student.id.in_(
+            text("SELECT rowid FROM student_fts WHERE student_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(column("rowid"))
+        )
+    if _dialect(session.get_bind()) == "postgresql":
+        # Spelled exactly like the index expression so the planner uses it
+        tsquery = " & ".join(term + (":*" if prefix else "") for term, prefix in terms)
+        return text(
+            f"{TS_DOCUMENT} @@ to_tsquery('{TS_CONFIG}', :tsquery)"
+        ).bindparams(tsquery=tsquery)
+    return and_(*[
+        Student.name.contains(term) | Student.email.contains(term) for term, _ in terms
+    ])
+
+
+def find_students(
+    session: Session,
+    email: Optional[str] = None,
+    name: Optional[str] = None,
+    query: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 50,
+) -> List[Student]:
+    """Students matching every given filter, in id order after the given id
+
+    Paging by "id > after" instead of OFFSET keeps every page as cheap as
+    the first one.
+    """
+    statement = select(Student)
+    if email is not None:
+        statement = statement.where(Student.email == normalize_email(email))
+    if name:
+        prefix = fold_name(name)
+        statement = statement.where(
+            Student.name_lower >= prefix, Student.name_lower < _prefix_end(prefix))
+    if query:
+        terms = parse_query(query)
+        if not terms:
+            return []
+        statement = statement.where(_text_match(session, terms))
+    if min_age is not None:
+        statement = statement.where(Student.age >= min_age)
+    if max_age is not None:
+        statement = statement.where(Student.age <= max_age)
+    if after is not None:
+        statement = statement.where(Student.id > after)
+    return session.exec(statement.order_by(Student.id).limit(limit)).all()